@@ -1,5 +1,6 @@
 import logging
 import secrets
+from typing import Literal
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -26,6 +27,33 @@ class Settings(BaseSettings):
     ops_dir: str = "/data/ops"
     repo_url: str = ""
     update_branch: str = "main"
+    # 鉴权结果进程内缓存（秒），0 表示关闭
+    auth_cache_ttl_seconds: int = 60
+    auth_cache_max_entries: int = 2048
+    # API Key last_used_at 批量落库间隔（秒）
+    api_key_usage_flush_seconds: int = 30
+    # 图片解码/缩略图进程池：工作进程数与允许排队的最大任务数（超出返回 429）
+    image_workers: int = 2
+    image_queue_limit: int = 8
+    # 引用数归零的媒体文件在最后一次上传后保留的秒数，避免删掉刚上传、尚未关联物料的文件
+    media_orphan_grace_seconds: int = 600
+    # 按需生成的图片尺寸/格式变体磁盘缓存上限（MB），超出后按最近访问时间淘汰
+    variant_cache_max_mb: int = 1024
+    # 操作日志写入模式：transactional 与业务同事务提交；buffered 提交后进内存缓冲，
+    # 按间隔或条数批量写入，崩溃时最多丢失一个刷新周期内的日志（durable 日志不受影响）
+    operation_log_mode: Literal["transactional", "buffered"] = "transactional"
+    operation_log_flush_seconds: float = 1.0
+    operation_log_batch_size: int = 500
+    operation_log_max_buffer: int = 20000
+    # operation_logs 按月分区：提前创建的月份数；超过保留月数的分区分离后压缩归档到 ops_dir（0 表示不归档）
+    operation_log_partition_months_ahead: int = 3
+    operation_log_retention_months: int = 12
+    # 孤立图片后台回收：执行间隔（秒，0 表示关闭）、每批扫描文件数、每秒最多删除文件数
+    media_gc_interval_seconds: int = 6 * 60 * 60
+    media_gc_batch_size: int = 500
+    media_gc_max_deletes_per_second: int = 20
+    # items 触发器追加的表格统计增量并入汇总行的间隔（秒，0 表示关闭，增量只在读取时相加）
+    table_stats_compact_seconds: int = 60
 
     def model_post_init(self, __context) -> None:
         # BUG-13: 未配置 JWT 密钥时自动生成随机密钥并警告
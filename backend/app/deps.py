@@ -1,17 +1,23 @@
-﻿from datetime import UTC, datetime
+﻿import uuid
+from dataclasses import dataclass
+from datetime import UTC, datetime
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import APIKeyHeader, HTTPAuthorizationCredentials, HTTPBearer
-from sqlalchemy import or_, select
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.cache import TTLCache
+from app.core.config import settings
 from app.core.database import get_session
 from app.core.request_context import clear_auth_context, set_auth_context
 from app.core.security import decode_access_token, hash_api_key
 from app.models import ApiKey, User
+from app.services.api_key_usage import touch_api_key
 
 bearer_scheme = HTTPBearer(auto_error=False)
 api_key_scheme = APIKeyHeader(name="X-API-Key", auto_error=False)
+_auth_cache = TTLCache(settings.auth_cache_max_entries, settings.auth_cache_ttl_seconds)
 
 
 async def _get_user_by_username(session: AsyncSession, username: str) -> User | None:
@@ -19,24 +25,42 @@ async def _get_user_by_username(session: AsyncSession, username: str) -> User |
     return result.scalar_one_or_none()
 
 
-async def _get_user_by_api_key(session: AsyncSession, raw_api_key: str) -> tuple[User, ApiKey] | None:
-    api_key_hash = hash_api_key(raw_api_key)
-    stmt = select(ApiKey).where(
-        or_(ApiKey.api_key == raw_api_key, ApiKey.key_hash == api_key_hash),
-        ApiKey.active.is_(True),
+async def _get_user_by_api_key(session: AsyncSession, api_key_hash: str) -> tuple[User, ApiKey] | None:
+    # 只按 key_hash 匹配（唯一索引），用户与密钥一次查询取回
+    stmt = (
+        select(User, ApiKey)
+        .join(ApiKey, ApiKey.owner_id == User.id)
+        .where(ApiKey.key_hash == api_key_hash, ApiKey.active.is_(True))
     )
     result = await session.execute(stmt)
-    api_key = result.scalar_one_or_none()
-    if not api_key:
+    row = result.one_or_none()
+    if not row:
         return None
+    return row[0], row[1]
+
+
+@dataclass(frozen=True)
+class _CachedAuth:
+    # 脱离 session 的 User 快照，命中后直接复用已加载的属性
+    user: User
+    auth_context: dict[str, str]
+    api_key_id: uuid.UUID | None = None
+
+
+def invalidate_cached_user(user_id: uuid.UUID) -> None:
+    # 账号删除或角色变更后调用，下一次请求会重新查库
+    _auth_cache.discard_where(lambda entry: entry.user.id == user_id)
 
-    # BUG-02: 只 flush 不 commit，让事务随 endpoint 一起提交
-    api_key.last_used_at = datetime.now(UTC)
-    await session.flush()
-    user = await session.get(User, api_key.owner_id)
-    if not user:
-        return None
-    return user, api_key
+
+def invalidate_cached_api_key(api_key_id: uuid.UUID) -> None:
+    _auth_cache.discard_where(lambda entry: entry.api_key_id == api_key_id)
+
+
+def _use_cached(entry: _CachedAuth) -> User:
+    set_auth_context(entry.auth_context)
+    if entry.api_key_id:
+        touch_api_key(entry.api_key_id)
+    return entry.user
 
 
 async def get_current_user(
@@ -47,33 +71,53 @@ async def get_current_user(
     clear_auth_context()
 
     if credentials and credentials.scheme.lower() == "bearer":
-        payload = decode_access_token(credentials.credentials)
+        token = credentials.credentials
+        cached = _auth_cache.get(("jwt", token))
+        if cached:
+            return _use_cached(cached)
+
+        payload = decode_access_token(token)
         if payload and payload.get("sub"):
             user = await _get_user_by_username(session, payload["sub"])
             if user:
-                set_auth_context(
-                    {
+                session.expunge(user)
+                entry = _CachedAuth(
+                    user=user,
+                    auth_context={
                         "operator_id": str(user.id),
                         "operator_username": user.username,
                         "auth_source": "jwt",
                         "auth_label": user.username,
-                    }
+                    },
                 )
-                return user
+                ttl = None
+                if payload.get("exp") is not None:
+                    ttl = float(payload["exp"]) - datetime.now(UTC).timestamp()
+                _auth_cache.set(("jwt", token), entry, ttl_seconds=ttl)
+                return _use_cached(entry)
 
     if api_key:
-        matched = await _get_user_by_api_key(session, api_key)
+        api_key_hash = hash_api_key(api_key)
+        cached = _auth_cache.get(("api_key", api_key_hash))
+        if cached:
+            return _use_cached(cached)
+
+        matched = await _get_user_by_api_key(session, api_key_hash)
         if matched:
             user, key_row = matched
-            set_auth_context(
-                {
+            session.expunge(user)
+            entry = _CachedAuth(
+                user=user,
+                auth_context={
                     "operator_id": str(user.id),
                     "operator_username": user.username,
                     "auth_source": "api_key",
                     "auth_label": f"{key_row.name} ({key_row.key_prefix})",
-                }
+                },
+                api_key_id=key_row.id,
             )
-            return user
+            _auth_cache.set(("api_key", api_key_hash), entry)
+            return _use_cached(entry)
 
     raise HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -1,5 +1,5 @@
 ﻿import asyncio
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 from pathlib import Path
 
 from fastapi import FastAPI
@@ -13,14 +13,23 @@ from app.core.security import get_password_hash, verify_password
 from app.models import User
 from app.routers.auth import router as auth_router
 from app.routers.config_schema import router as config_router
+from app.routers.events import router as events_router
 from app.routers.integration import router as integration_router
 from app.routers.items import router as items_router
+from app.routers.media import router as media_router
 from app.routers.stock import router as stock_router
 from app.routers.system_ops import router as system_ops_router
 from app.routers.tables import router as tables_router
 from app.routers.upload import router as upload_router
 from app.routers.users import router as users_router
+from app.services.api_key_usage import run_api_key_usage_flusher
+from app.services.events import run_event_listener
+from app.services.image_processing import shutdown_image_pool
+from app.services.log_partitions import run_log_partition_maintenance
+from app.services.logs import run_operation_log_flusher
+from app.services.media_gc import run_media_gc_loop
 from app.services.migration import bind_legacy_items_to_default_table, ensure_default_table, migrate_schema
+from app.services.table_stats import run_table_stats_compactor
 
 
 async def init_database() -> None:
@@ -69,7 +78,32 @@ async def lifespan(_: FastAPI):
     Path(settings.images_dir, "thumbs").mkdir(parents=True, exist_ok=True)
     await init_database()
     await init_data()
+    usage_flusher = asyncio.create_task(run_api_key_usage_flusher())
+    log_flusher = asyncio.create_task(run_operation_log_flusher())
+    event_listener = asyncio.create_task(run_event_listener())
+    media_gc = asyncio.create_task(run_media_gc_loop())
+    log_partitions = asyncio.create_task(run_log_partition_maintenance())
+    stats_compactor = asyncio.create_task(run_table_stats_compactor())
     yield
+    stats_compactor.cancel()
+    log_partitions.cancel()
+    media_gc.cancel()
+    event_listener.cancel()
+    usage_flusher.cancel()
+    with suppress(asyncio.CancelledError):
+        await stats_compactor
+    with suppress(asyncio.CancelledError):
+        await log_partitions
+    with suppress(asyncio.CancelledError):
+        await media_gc
+    with suppress(asyncio.CancelledError):
+        await event_listener
+    with suppress(asyncio.CancelledError):
+        await usage_flusher
+    log_flusher.cancel()
+    with suppress(asyncio.CancelledError):
+        await log_flusher
+    shutdown_image_pool()
 
 
 app = FastAPI(title=settings.app_name, lifespan=lifespan)
@@ -79,6 +113,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
     allow_credentials=True,
+    expose_headers=["ETag"],
 )
 
 app.mount("/media", StaticFiles(directory=settings.images_dir, check_dir=False), name="media")
@@ -88,7 +123,9 @@ app.include_router(users_router)
 app.include_router(tables_router)
 app.include_router(items_router)
 app.include_router(stock_router)
+app.include_router(events_router)
 app.include_router(upload_router)
+app.include_router(media_router)
 app.include_router(config_router)
 app.include_router(integration_router)
 app.include_router(system_ops_router)
@@ -1,7 +1,19 @@
 ﻿import uuid
 from datetime import UTC, datetime
 
-from sqlalchemy import Boolean, DateTime, ForeignKey, Integer, String, Text, UniqueConstraint
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    DateTime,
+    FetchedValue,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Text,
+    UniqueConstraint,
+    text,
+)
 from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
@@ -12,6 +24,11 @@ def now_utc() -> datetime:
     return datetime.now(UTC)
 
 
+def as_utc(value: datetime) -> datetime:
+    # 查询参数里不带时区的时间按 UTC 解释
+    return value if value.tzinfo else value.replace(tzinfo=UTC)
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -31,6 +48,8 @@ class InventoryTable(Base):
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     name: Mapped[str] = mapped_column(String(120), unique=True, index=True, nullable=False)
     schema: Mapped[dict] = mapped_column(JSONB, nullable=False, default=dict)
+    # 表格及其物料每次写入都从 inventory_change_seq 取新值，用于 ETag
+    change_version: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0, server_default="0")
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=now_utc, nullable=False)
     updated_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
@@ -43,9 +62,49 @@ class InventoryTable(Base):
     items: Mapped[list["Item"]] = relationship(back_populates="table")
 
 
+class InventoryTableStats(Base):
+    """按表格汇总的物料统计；items 上的触发器只追加增量行，由后台任务并入这里。"""
+
+    __tablename__ = "inventory_table_stats"
+
+    table_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey("inventory_tables.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    item_count: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    total_quantity: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    zero_stock_count: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    low_stock_count: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=now_utc, nullable=False)
+
+
+class InventoryTableStatsDelta(Base):
+    """物料写入产生的统计增量，只追加；读取时与汇总行相加，后台任务定期并入 inventory_table_stats。"""
+
+    __tablename__ = "inventory_table_stats_deltas"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    table_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False, index=True)
+    item_count: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    total_quantity: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    zero_stock_count: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    low_stock_count: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=now_utc, nullable=False)
+
+
 class Item(Base):
     __tablename__ = "items"
-    __table_args__ = (UniqueConstraint("table_id", "code", name="uq_items_table_code"),)
+    __table_args__ = (
+        UniqueConstraint("table_id", "code", name="uq_items_table_code"),
+        # keyset 分页：ORDER BY updated_at DESC, id DESC（btree 可反向扫描）
+        Index("ix_items_updated_id", "updated_at", "id"),
+        Index("ix_items_table_updated_id", "table_id", "updated_at", "id"),
+        # 低库存列表只扫描部分索引，规模与低库存物料数相关，与物料总数无关
+        Index("ix_items_low_stock", "table_id", "quantity", "id", postgresql_where=text("is_low_stock")),
+    )
+    # is_low_stock 由数据库触发器维护，写入后通过 RETURNING 取回
+    __mapper_args__ = {"eager_defaults": True}
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     table_id: Mapped[uuid.UUID] = mapped_column(
@@ -57,8 +116,16 @@ class Item(Base):
     name: Mapped[str] = mapped_column(String(120), nullable=False, index=True)
     code: Mapped[str] = mapped_column(String(80), nullable=False, index=True)
     quantity: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
-    image_original: Mapped[str | None] = mapped_column(String(255), nullable=True)
-    image_thumb: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    # 物料级补货阈值，为空时使用表格 schema.low_stock_threshold
+    reorder_level: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    is_low_stock: Mapped[bool] = mapped_column(
+        Boolean,
+        nullable=False,
+        server_default=text("false"),
+        server_onupdate=FetchedValue(),
+    )
+    image_original: Mapped[str | None] = mapped_column(String(255), nullable=True, index=True)
+    image_thumb: Mapped[str | None] = mapped_column(String(255), nullable=True, index=True)
     notes: Mapped[str | None] = mapped_column(Text, nullable=True)
     properties: Mapped[dict] = mapped_column(JSONB, nullable=False, default=dict)
     updated_at: Mapped[datetime] = mapped_column(
@@ -72,6 +139,36 @@ class Item(Base):
     table: Mapped["InventoryTable"] = relationship(back_populates="items")
 
 
+class ItemChange(Base):
+    """每个物料一行的变更记录（含删除墓碑），由 items 上的语句级触发器维护。"""
+
+    __tablename__ = "item_changes"
+    __table_args__ = (
+        # 增量同步按 (txid, item_id) 顺序读取
+        Index("ix_item_changes_txid_item", "txid", "item_id"),
+        Index("ix_item_changes_table_txid_item", "table_id", "txid", "item_id"),
+    )
+
+    item_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True)
+    table_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
+    deleted: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+    # 最近一次写入该物料的事务号（pg_current_xact_id）
+    txid: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    changed_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=now_utc, nullable=False)
+
+
+class MediaFile(Base):
+    """按内容哈希命名的媒体文件及其引用计数，ref_count 由 items 上的触发器维护。"""
+
+    __tablename__ = "media_files"
+
+    path: Mapped[str] = mapped_column(String(255), primary_key=True)
+    sha256: Mapped[str | None] = mapped_column(String(64), nullable=True, index=True)
+    size: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    ref_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    last_uploaded_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=now_utc, nullable=False)
+
+
 class ApiKey(Base):
     __tablename__ = "api_keys"
 
@@ -93,20 +190,60 @@ class ApiKey(Base):
     owner: Mapped["User"] = relationship(back_populates="api_keys")
 
 
+class StockMovement(Base):
+    """库存流水：只追加，不随物料删除，数量变化以带类型的列保存。"""
+
+    __tablename__ = "stock_movements"
+    __table_args__ = (
+        # 单品流水与按表格的期间汇总都是 (键, created_at) 上的范围扫描
+        Index("ix_stock_movements_item_created_id", "item_id", "created_at", "id"),
+        Index("ix_stock_movements_table_created_id", "table_id", "created_at", "id"),
+    )
+
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    item_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
+    table_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
+    code: Mapped[str] = mapped_column(String(80), nullable=False)
+    delta: Mapped[int] = mapped_column(Integer, nullable=False)
+    quantity_after: Mapped[int] = mapped_column(Integer, nullable=False)
+    operator_id: Mapped[uuid.UUID | None] = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey("users.id", ondelete="SET NULL"),
+        nullable=True,
+    )
+    source: Mapped[str] = mapped_column(String(20), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=now_utc, nullable=False)
+
+
 class OperationLog(Base):
     __tablename__ = "operation_logs"
+    __table_args__ = (
+        # 最近日志按 created_at DESC 读取，分区内走索引倒序扫描
+        Index("ix_operation_logs_created_id", "created_at", "id"),
+        # 审计过滤：等值字段在前、(created_at, id) 在后，过滤后仍可按 keyset 顺序读取
+        Index("ix_operation_logs_action_created_id", "action", "created_at", "id"),
+        Index("ix_operation_logs_operator_created_id", "operator_id", "created_at", "id"),
+        Index("ix_operation_logs_target_created_id", "target", "created_at", "id"),
+        # 按月范围分区，分区由 services/log_partitions 预先创建与归档
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     operator_id: Mapped[uuid.UUID | None] = mapped_column(
         UUID(as_uuid=True),
         ForeignKey("users.id", ondelete="SET NULL"),
         nullable=True,
-        index=True,
     )
-    action: Mapped[str] = mapped_column(String(80), nullable=False, index=True)
+    action: Mapped[str] = mapped_column(String(80), nullable=False)
     target: Mapped[str] = mapped_column(String(120), nullable=False, default="")
     summary: Mapped[str] = mapped_column(String(255), nullable=False, default="")
     detail: Mapped[dict] = mapped_column(JSONB, nullable=False, default=dict)
-    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=now_utc, nullable=False)
+    # 分区表的主键必须包含分区键
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        primary_key=True,
+        default=now_utc,
+        nullable=False,
+    )
 
     operator: Mapped["User | None"] = relationship(back_populates="logs")
@@ -2,14 +2,23 @@ import uuid
 from datetime import UTC, datetime
 from typing import Any
 
-from fastapi import APIRouter, Body, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response, status
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.database import get_session
 from app.deps import get_current_user
 from app.models import InventoryTable, User
+from app.services.change_versions import (
+    apply_etag,
+    bump_table_version,
+    current_etag,
+    is_not_modified,
+    not_modified_response,
+)
+from app.services.events import publish_events, table_event
 from app.services.logs import log_operation
+from app.services.table_stats import low_stock_threshold, refresh_low_stock_flags, schema_low_stock_threshold
 
 router = APIRouter(prefix="/config", tags=["config"])
 
@@ -25,11 +34,18 @@ def schema_response(table: InventoryTable) -> dict[str, Any]:
 
 @router.get("/schema")
 async def get_schema(
+    request: Request,
+    response: Response,
     table_id: uuid.UUID | None = Query(default=None, description="表格ID"),
     table_name: str | None = Query(default=None, description="表格名称"),
     session: AsyncSession = Depends(get_session),
     _: User = Depends(get_current_user),
 ) -> dict[str, Any]:
+    # 按名称或"最近更新"查找时目标表格可能变化，只有指定 table_id 时才用单表版本
+    etag = await current_etag(request, session, table_id)
+    if etag and is_not_modified(request, etag):
+        return not_modified_response(etag)
+
     table = None
     if table_id:
         table = await session.get(InventoryTable, table_id)
@@ -47,6 +63,7 @@ async def get_schema(
             "schema": {},
             "updated_at": datetime.now(UTC),
         }
+    apply_etag(response, etag)
     return schema_response(table)
 
 
@@ -75,7 +92,12 @@ async def set_schema(
     if not table:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="表格不存在")
 
+    # 先刷新物料标记、再改表格行：与物料写入同样先锁物料后锁表格，避免互相死锁
+    threshold = schema_low_stock_threshold(schema_data)
+    if threshold != low_stock_threshold(table):
+        await refresh_low_stock_flags(session, table.id, threshold)
     table.schema = schema_data
+    bump_table_version(session, table.id)
     await log_operation(
         session=session,
         action="update_schema",
@@ -84,6 +106,7 @@ async def set_schema(
         detail={"table_id": str(table.id), "fields_count": len(schema_data.get("fields", []))},
         operator_id=current_user.id,
     )
+    await publish_events(session, [table_event("updated", table.id)])
     await session.commit()
     await session.refresh(table)
     return schema_response(table)
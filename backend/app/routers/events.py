@@ -0,0 +1,46 @@
+import asyncio
+import json
+import uuid
+from collections.abc import AsyncIterator
+
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import StreamingResponse
+
+from app.deps import get_current_user
+from app.models import User
+from app.services.events import event_hub
+
+router = APIRouter(prefix="/events", tags=["events"])
+HEARTBEAT_SECONDS = 15
+
+
+async def _sse_stream(request: Request, table_id: uuid.UUID | None) -> AsyncIterator[str]:
+    # 在生成器内订阅，保证客户端提前断开时也会执行退订
+    subscriber = event_hub.subscribe(table_id)
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            if await request.is_disconnected():
+                break
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), timeout=HEARTBEAT_SECONDS)
+            except TimeoutError:
+                # 注释行作为心跳，防止代理因空闲断开连接
+                yield ": ping\n\n"
+                continue
+            yield f"event: {event.get('kind', 'item')}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+    finally:
+        event_hub.unsubscribe(subscriber)
+
+
+@router.get("/items")
+async def stream_item_events(
+    request: Request,
+    table_id: uuid.UUID | None = Query(default=None, description="只接收该表格的事件"),
+    _: User = Depends(get_current_user),
+) -> StreamingResponse:
+    return StreamingResponse(
+        _sse_stream(request, table_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
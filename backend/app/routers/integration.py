@@ -1,15 +1,18 @@
 import uuid
+from datetime import datetime
 
 from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
-from sqlalchemy import select
+from sqlalchemy import ColumnElement, String, literal, literal_column, or_, select, tuple_
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.database import get_session
 from app.core.security import generate_api_key, hash_api_key
-from app.deps import get_current_user
-from app.models import ApiKey, OperationLog, User
-from app.schemas import ApiKeyCreateRequest, ApiKeyCreatedResponse, ApiKeyReadResponse, LogReadResponse
+from app.deps import get_current_user, invalidate_cached_api_key
+from app.models import ApiKey, OperationLog, User, as_utc
+from app.schemas import ApiKeyCreateRequest, ApiKeyCreatedResponse, ApiKeyReadResponse, LogPage, LogReadResponse
 from app.services.logs import log_operation
+from app.services.pagination import decode_cursor, encode_cursor
 
 router = APIRouter(prefix="/integration", tags=["integration"])
 
@@ -50,28 +53,47 @@ async def get_api_reference(
         "users": ["GET /users (admin)", "POST /users (admin)", "DELETE /users/{id} (admin)"],
         "tables": [
             "GET /tables",
+            "GET /tables?include_stats=true",
+            "GET /tables/{id}/stats",
             "POST /tables",
             "PATCH /tables/{id}",
             "DELETE /tables/{id}",
             "DELETE /tables/{id}?purge_items=true",
+            "GET /tables/purge-jobs/{job_id}",
+            "GET /tables/{id}/export?format=csv|ndjson",
+            "POST /tables/{id}/import?quantity_mode=set|add",
         ],
         "schema": ["GET /config/schema", "PUT /config/schema", "POST /config/schema"],
         "items": [
             "GET /items",
+            "GET /items?filters=<JSON>",
+            "GET /items/page?limit=&cursor=",
+            "GET /items/search?q=",
+            "GET /items/changes?since=&table_id=",
+            "GET /items/low-stock?table_id=&limit=",
             "GET /items/{id}",
             "POST /items",
             "PATCH /items/{id}",
             "DELETE /items/{id}",
         ],
-        "stock": ["POST /stock/in", "POST /stock/out"],
-        "upload": ["POST /upload"],
+        "stock": [
+            "POST /stock/in",
+            "POST /stock/out",
+            "POST /stock/batch",
+            "GET /stock/movements?item_id=&table_id=&start=&end=&cursor=&limit=",
+            "GET /stock/turnover?table_id=&start=&end=&limit=",
+        ],
+        "events": ["GET /events/items?table_id= (text/event-stream)"],
+        "upload": ["POST /upload", "POST /upload?async_thumbnail=true", "GET /upload/status"],
+        "media": ["GET /media/{path}", "GET /media-variants/{path}?w=64|150|300|600|1200&format=jpeg|webp|avif"],
         "integration": [
             "GET /integration/api-info",
             "GET /integration/api-reference",
             "GET /integration/api-keys",
             "POST /integration/api-keys",
             "DELETE /integration/api-keys/{id}",
-            "GET /integration/logs",
+            "GET /integration/logs?action=&operator_id=&auth_source=&target=&item_id=&start=&end=",
+            "GET /integration/logs/page?cursor=&limit=&action=&operator_id=&auth_source=&target=&item_id=&start=&end=",
         ],
         "system": [
             "GET /system/tailscale/config (admin)",
@@ -85,6 +107,9 @@ async def get_api_reference(
             "GET /system/version/tags (admin)",
             "POST /system/version/rollback (admin)",
             "POST /system/version/rollback/latest (admin)",
+            "GET /system/media-gc/report (admin)",
+            "POST /system/media-gc/run (admin, 202 + job)",
+            "GET /system/media-gc/jobs/{job_id} (admin)",
         ],
     }
 
@@ -113,6 +138,7 @@ async def create_api_key(
         summary=f"Create API key {record.name}",
         detail={"api_key_id": str(record.id), "key_prefix": record.key_prefix},
         operator_id=current_user.id,
+        durable=True,
     )
     await session.commit()
     await session.refresh(record)
@@ -173,20 +199,56 @@ async def disable_api_key(
         summary=f"Disable API key {row.name}",
         detail={"api_key_id": str(row.id)},
         operator_id=current_user.id,
+        durable=True,
     )
     await session.commit()
+    invalidate_cached_api_key(row.id)
 
 
-@router.get("/logs", response_model=list[LogReadResponse])
-async def list_logs(
-    limit: int = Query(default=100, ge=1, le=500),
-    session: AsyncSession = Depends(get_session),
-    _: User = Depends(get_current_user),
-) -> list[LogReadResponse]:
-    stmt = select(OperationLog).order_by(OperationLog.created_at.desc()).limit(limit)
-    result = await session.execute(stmt)
-    rows = list(result.scalars().all())
+def _log_filter_conditions(
+    action: str | None = Query(default=None, description="按操作类型过滤，如 stock_in"),
+    operator_id: uuid.UUID | None = Query(default=None, description="按操作人过滤"),
+    auth_source: str | None = Query(default=None, description="按认证来源过滤，如 api_key"),
+    target: str | None = Query(default=None, description="按操作对象过滤"),
+    item_id: uuid.UUID | None = Query(default=None, description="按物料过滤，包含批量出入库明细"),
+    start: datetime | None = Query(default=None, description="起始时间（含）"),
+    end: datetime | None = Query(default=None, description="结束时间（不含）"),
+) -> list[ColumnElement[bool]]:
+    # 每个过滤条件都有 (字段, created_at, id) 复合索引，过滤后仍按索引顺序分页；
+    # 时间范围同时用于分区裁剪
+    conditions: list[ColumnElement[bool]] = []
+    if action:
+        conditions.append(OperationLog.action == action)
+    if operator_id:
+        conditions.append(OperationLog.operator_id == operator_id)
+    if auth_source:
+        conditions.append(_detail_text("auth_source") == auth_source)
+    if target:
+        conditions.append(OperationLog.target == target)
+    if item_id:
+        conditions.append(
+            or_(
+                _detail_text("item_id") == str(item_id),
+                _detail_changes().op("@>")(literal([{"item_id": str(item_id)}], JSONB)),
+            )
+        )
+    if start:
+        conditions.append(OperationLog.created_at >= as_utc(start))
+    if end:
+        conditions.append(OperationLog.created_at < as_utc(end))
+    return conditions
+
+
+def _detail_text(key: str) -> ColumnElement[str]:
+    # 键名必须是 SQL 字面量，表达式才能与 (detail->>'key') 索引匹配
+    return OperationLog.detail.op("->>", return_type=String)(literal_column(f"'{key}'"))
+
 
+def _detail_changes() -> ColumnElement:
+    return OperationLog.detail.op("->", return_type=JSONB)(literal_column("'changes'"))
+
+
+async def _log_responses(session: AsyncSession, rows: list[OperationLog]) -> list[LogReadResponse]:
     operator_ids = {row.operator_id for row in rows if row.operator_id}
     user_map: dict[uuid.UUID, str] = {}
     if operator_ids:
@@ -216,3 +278,47 @@ async def list_logs(
             )
         )
     return payload
+
+
+@router.get("/logs", response_model=list[LogReadResponse])
+async def list_logs(
+    limit: int = Query(default=100, ge=1, le=500),
+    conditions: list[ColumnElement[bool]] = Depends(_log_filter_conditions),
+    session: AsyncSession = Depends(get_session),
+    _: User = Depends(get_current_user),
+) -> list[LogReadResponse]:
+    stmt = (
+        select(OperationLog)
+        .where(*conditions)
+        .order_by(OperationLog.created_at.desc(), OperationLog.id.desc())
+        .limit(limit)
+    )
+    result = await session.execute(stmt)
+    return await _log_responses(session, list(result.scalars().all()))
+
+
+@router.get("/logs/page", response_model=LogPage)
+async def list_logs_page(
+    limit: int = Query(default=100, ge=1, le=500),
+    cursor: str | None = Query(default=None, description="上一页返回的 next_cursor"),
+    conditions: list[ColumnElement[bool]] = Depends(_log_filter_conditions),
+    session: AsyncSession = Depends(get_session),
+    _: User = Depends(get_current_user),
+) -> LogPage:
+    # 按 (created_at, id) 做 keyset 分页，翻页深度不影响单页耗时
+    stmt = select(OperationLog).where(*conditions)
+    if cursor:
+        cursor_created_at, cursor_id = decode_cursor(cursor)
+        stmt = stmt.where(
+            tuple_(OperationLog.created_at, OperationLog.id)
+            < tuple_(cursor_created_at, cursor_id, types=[OperationLog.created_at.type, OperationLog.id.type])
+        )
+    stmt = stmt.order_by(OperationLog.created_at.desc(), OperationLog.id.desc()).limit(limit + 1)
+
+    result = await session.execute(stmt)
+    rows = list(result.scalars().all())
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return LogPage(logs=await _log_responses(session, rows), next_cursor=next_cursor)
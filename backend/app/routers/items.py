@@ -1,17 +1,36 @@
 import uuid
-from pathlib import Path
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy import String, or_, select
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy import BigInteger, ColumnElement, String, Text, func, literal, or_, select, tuple_
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.config import settings
 from app.core.database import get_session
 from app.deps import get_current_user
-from app.models import InventoryTable, Item, User
-from app.schemas import ItemCreate, ItemRead, ItemUpdate, _Unset
+from app.models import InventoryTable, Item, ItemChange, User
+from app.schemas import (
+    ItemChangeRead,
+    ItemChangesPage,
+    ItemCreate,
+    ItemPage,
+    ItemRead,
+    ItemSearchHit,
+    ItemUpdate,
+    _Unset,
+)
+from app.services.change_versions import (
+    apply_etag,
+    bump_table_version,
+    current_etag,
+    is_not_modified,
+    not_modified_response,
+)
+from app.services.events import deleted_item_event, item_event, publish_events
+from app.services.item_filters import parse_property_filters
 from app.services.logs import log_operation
+from app.services.media_store import cleanup_unreferenced_media
+from app.services.pagination import decode_change_cursor, decode_cursor, encode_change_cursor, encode_cursor
+from app.services.stock_movements import movement_row, record_movements
 
 router = APIRouter(tags=["items"])
 
@@ -23,48 +42,7 @@ async def _ensure_table(session: AsyncSession, table_id: uuid.UUID) -> Inventory
     return table
 
 
-def _resolve_media_path(relative_path: str | None) -> Path | None:
-    normalized = str(relative_path or "").strip().replace("\\", "/").lstrip("/")
-    if not normalized:
-        return None
-
-    images_root = Path(settings.images_dir).resolve()
-    candidate = (images_root / normalized).resolve()
-    try:
-        candidate.relative_to(images_root)
-    except ValueError:
-        return None
-    return candidate
-
-
-async def _cleanup_media_if_unused(
-    session: AsyncSession,
-    relative_path: str | None,
-    exclude_item_id: uuid.UUID | None = None,
-) -> None:
-    normalized = str(relative_path or "").strip()
-    if not normalized:
-        return
-
-    stmt = select(Item.id).where(or_(Item.image_original == normalized, Item.image_thumb == normalized)).limit(1)
-    if exclude_item_id:
-        stmt = stmt.where(Item.id != exclude_item_id)
-    in_use = await session.execute(stmt)
-    if in_use.scalar_one_or_none():
-        return
-
-    absolute_path = _resolve_media_path(normalized)
-    if not absolute_path:
-        return
-    try:
-        absolute_path.unlink(missing_ok=True)
-    except OSError:
-        # Keep request successful even if stale file cleanup fails.
-        return
-
-
-@router.get("/items", response_model=list[ItemRead])
-async def list_items(
+def _item_filter_conditions(
     table_id: uuid.UUID | None = Query(default=None, description="按表格过滤"),
     q: str | None = Query(default=None, description="按名称或编码模糊搜索"),
     code: str | None = Query(default=None, description="按编码精确搜索"),
@@ -72,32 +50,191 @@ async def list_items(
     max_quantity: int | None = Query(default=None, ge=0),
     property_key: str | None = Query(default=None, description="JSONB 属性键"),
     property_value: str | None = Query(default=None, description="JSONB 属性值"),
-    session: AsyncSession = Depends(get_session),
-    _: User = Depends(get_current_user),
-) -> list[ItemRead]:
-    stmt = select(Item)
-
+    filters: str | None = Query(
+        default=None,
+        description='多属性条件 JSON，如 {"颜色": "红", "尺码": {"in": ["S", "M"]}, "型号": {"prefix": "AB"}, "重量": {"gte": 1}}',
+    ),
+) -> list[ColumnElement[bool]]:
+    conditions: list[ColumnElement[bool]] = []
     if table_id:
-        stmt = stmt.where(Item.table_id == table_id)
+        conditions.append(Item.table_id == table_id)
     if q:
         pattern = f"%{q.strip()}%"
-        stmt = stmt.where(or_(Item.name.ilike(pattern), Item.code.ilike(pattern)))
+        conditions.append(or_(Item.name.ilike(pattern), Item.code.ilike(pattern)))
     if code:
-        stmt = stmt.where(Item.code == code)
+        conditions.append(Item.code == code)
     if min_quantity is not None:
-        stmt = stmt.where(Item.quantity >= min_quantity)
+        conditions.append(Item.quantity >= min_quantity)
     if max_quantity is not None:
-        stmt = stmt.where(Item.quantity <= max_quantity)
+        conditions.append(Item.quantity <= max_quantity)
     if property_key:
-        stmt = stmt.where(Item.properties.has_key(property_key))  # type: ignore[attr-defined]
+        conditions.append(Item.properties.has_key(property_key))  # type: ignore[attr-defined]
     if property_key and property_value is not None:
-        stmt = stmt.where(Item.properties[property_key].astext.cast(String) == property_value)
+        conditions.append(Item.properties[property_key].astext.cast(String) == property_value)
+    if filters:
+        conditions.extend(parse_property_filters(filters))
+    return conditions
+
+
+def _query_table_id(request: Request) -> uuid.UUID | None:
+    # table_id 已由 _item_filter_conditions 校验过格式
+    raw = request.query_params.get("table_id")
+    return uuid.UUID(raw) if raw else None
+
+
+@router.get("/items", response_model=list[ItemRead])
+async def list_items(
+    request: Request,
+    response: Response,
+    conditions: list[ColumnElement[bool]] = Depends(_item_filter_conditions),
+    session: AsyncSession = Depends(get_session),
+    _: User = Depends(get_current_user),
+) -> list[ItemRead]:
+    etag = await current_etag(request, session, _query_table_id(request))
+    if etag and is_not_modified(request, etag):
+        return not_modified_response(etag)
 
-    stmt = stmt.order_by(Item.updated_at.desc())
+    stmt = select(Item).where(*conditions).order_by(Item.updated_at.desc(), Item.id.desc())
     result = await session.execute(stmt)
+    apply_etag(response, etag)
     return list(result.scalars().all())
 
 
+@router.get("/items/page", response_model=ItemPage)
+async def list_items_page(
+    request: Request,
+    response: Response,
+    limit: int = Query(default=100, ge=1, le=500),
+    cursor: str | None = Query(default=None, description="上一页返回的 next_cursor"),
+    conditions: list[ColumnElement[bool]] = Depends(_item_filter_conditions),
+    session: AsyncSession = Depends(get_session),
+    _: User = Depends(get_current_user),
+) -> ItemPage:
+    etag = await current_etag(request, session, _query_table_id(request))
+    if etag and is_not_modified(request, etag):
+        return not_modified_response(etag)
+
+    # 按 (updated_at, id) 做 keyset 分页，配合 ix_items_updated_id / ix_items_table_updated_id，
+    # 单页耗时与翻页深度无关
+    stmt = select(Item).where(*conditions)
+    if cursor:
+        cursor_updated_at, cursor_id = decode_cursor(cursor)
+        stmt = stmt.where(
+            tuple_(Item.updated_at, Item.id)
+            < tuple_(cursor_updated_at, cursor_id, types=[Item.updated_at.type, Item.id.type])
+        )
+    stmt = stmt.order_by(Item.updated_at.desc(), Item.id.desc()).limit(limit + 1)
+
+    result = await session.execute(stmt)
+    rows = list(result.scalars().all())
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].updated_at, rows[-1].id)
+    apply_etag(response, etag)
+    return ItemPage(items=[ItemRead.model_validate(row) for row in rows], next_cursor=next_cursor)
+
+
+@router.get("/items/search", response_model=list[ItemSearchHit])
+async def search_items(
+    q: str = Query(min_length=1, max_length=120, description="名称或编码，支持部分条码与错别字"),
+    table_id: uuid.UUID | None = Query(default=None, description="按表格过滤"),
+    limit: int = Query(default=50, ge=1, le=200),
+    session: AsyncSession = Depends(get_session),
+    _: User = Depends(get_current_user),
+) -> list[ItemSearchHit]:
+    term = q.strip()
+    if not term:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="搜索内容不能为空")
+
+    # <% 与 ILIKE 都可以走 ix_items_name_trgm / ix_items_code_trgm（pg_trgm GIN）
+    pattern = f"%{term}%"
+    term_literal = literal(term, String)
+    score = func.greatest(func.word_similarity(term_literal, Item.name), func.word_similarity(term_literal, Item.code))
+    stmt = select(Item, score.label("score")).where(
+        or_(
+            term_literal.op("<%")(Item.name),
+            term_literal.op("<%")(Item.code),
+            Item.name.ilike(pattern),
+            Item.code.ilike(pattern),
+        )
+    )
+    if table_id:
+        stmt = stmt.where(Item.table_id == table_id)
+    stmt = stmt.order_by((Item.code == term).desc(), score.desc(), Item.updated_at.desc()).limit(limit)
+
+    result = await session.execute(stmt)
+    hits: list[ItemSearchHit] = []
+    for item, item_score in result.all():
+        hit = ItemSearchHit.model_validate(item)
+        hit.score = round(float(item_score or 0), 4)
+        hits.append(hit)
+    return hits
+
+
+@router.get("/items/changes", response_model=ItemChangesPage)
+async def list_item_changes(
+    since: str | None = Query(default=None, description="上一次返回的 next_since，为空时从头全量同步"),
+    table_id: uuid.UUID | None = Query(default=None, description="按表格过滤"),
+    limit: int = Query(default=500, ge=1, le=2000),
+    session: AsyncSession = Depends(get_session),
+    _: User = Depends(get_current_user),
+) -> ItemChangesPage:
+    # 按写入事务号排序，只返回早于当前快照 xmin 的事务：
+    # 这些事务都已结束，之后提交的变更事务号一定更大，游标推进不会漏掉记录
+    snapshot_xmin = select(
+        func.pg_snapshot_xmin(func.pg_current_snapshot()).cast(Text).cast(BigInteger)
+    ).scalar_subquery()
+    stmt = (
+        select(ItemChange, Item)
+        .outerjoin(Item, Item.id == ItemChange.item_id)
+        .where(ItemChange.txid < snapshot_xmin)
+    )
+    if since:
+        since_txid, since_item_id = decode_change_cursor(since)
+        stmt = stmt.where(tuple_(ItemChange.txid, ItemChange.item_id) > tuple_(since_txid, since_item_id))
+    if table_id:
+        stmt = stmt.where(ItemChange.table_id == table_id)
+    stmt = stmt.order_by(ItemChange.txid, ItemChange.item_id).limit(limit + 1)
+
+    result = await session.execute(stmt)
+    rows = list(result.all())
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    changes: list[ItemChangeRead] = []
+    for change, item in rows:
+        deleted = change.deleted or item is None
+        changes.append(
+            ItemChangeRead(
+                item_id=change.item_id,
+                table_id=change.table_id,
+                op="delete" if deleted else "upsert",
+                changed_at=change.changed_at,
+                item=None if deleted else ItemRead.model_validate(item),
+            )
+        )
+    next_since = encode_change_cursor(rows[-1][0].txid, rows[-1][0].item_id) if rows else since
+    return ItemChangesPage(changes=changes, next_since=next_since, has_more=has_more)
+
+
+@router.get("/items/low-stock", response_model=list[ItemRead])
+async def list_low_stock_items(
+    table_id: uuid.UUID | None = Query(default=None, description="按表格过滤"),
+    limit: int = Query(default=200, ge=1, le=1000),
+    session: AsyncSession = Depends(get_session),
+    _: User = Depends(get_current_user),
+) -> list[ItemRead]:
+    # is_low_stock 由触发器按物料 reorder_level（为空时取表格阈值）维护，
+    # 条件与部分索引 ix_items_low_stock 一致，只扫描低库存物料
+    stmt = select(Item).where(Item.is_low_stock)
+    if table_id:
+        stmt = stmt.where(Item.table_id == table_id)
+    stmt = stmt.order_by(Item.table_id, Item.quantity, Item.id).limit(limit)
+    result = await session.execute(stmt)
+    return [ItemRead.model_validate(item) for item in result.scalars().all()]
+
+
 @router.get("/items/{item_id}", response_model=ItemRead)
 async def get_item(
     item_id: uuid.UUID,
@@ -117,11 +254,13 @@ async def create_item(
     current_user: User = Depends(get_current_user),
 ) -> ItemRead:
     table = await _ensure_table(session, payload.table_id)
+    bump_table_version(session, table.id)
     item = Item(
         table_id=payload.table_id,
         name=payload.name,
         code=payload.code,
         quantity=payload.quantity,
+        reorder_level=payload.reorder_level,
         image_original=payload.image_original,
         image_thumb=payload.image_thumb,
         notes=payload.notes,
@@ -145,6 +284,8 @@ async def create_item(
         detail={"item_id": str(item.id), "table_id": str(item.table_id), "quantity": item.quantity},
         operator_id=current_user.id,
     )
+    await record_movements(session, [movement_row(item, item.quantity, "item_create", current_user.id)])
+    await publish_events(session, [item_event("created", item)])
     await session.commit()
     await session.refresh(item)
     return ItemRead.model_validate(item)
@@ -157,10 +298,13 @@ async def update_item(
     session: AsyncSession = Depends(get_session),
     current_user: User = Depends(get_current_user),
 ) -> ItemRead:
-    item = await session.get(Item, item_id)
+    # 锁定物料行：读到的数量不会再被并发写入改变，流水的 delta 以它为准
+    item = await session.get(Item, item_id, with_for_update=True)
     if not item:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="物料不存在")
 
+    bump_table_version(session, item.table_id)
+    old_quantity = item.quantity
     old_image_original = item.image_original
     old_image_thumb = item.image_thumb
 
@@ -171,7 +315,7 @@ async def update_item(
             setattr(item, field_name, value)
 
     # BUG-01: nullable 字段使用 _Unset 哨兵值区分 "未提供" 和 "要清空"
-    for field_name in ("image_original", "image_thumb", "notes"):
+    for field_name in ("reorder_level", "image_original", "image_thumb", "notes"):
         value = getattr(payload, field_name)
         if value is not _Unset.UNSET:
             setattr(item, field_name, value)
@@ -210,6 +354,8 @@ async def update_item(
         detail={"item_id": str(item.id), "table_id": str(item.table_id)},
         operator_id=current_user.id,
     )
+    await record_movements(session, [movement_row(item, item.quantity - old_quantity, "item_update", current_user.id)])
+    await publish_events(session, [item_event("updated", item)])
     await session.commit()
     await session.refresh(item)
 
@@ -218,8 +364,7 @@ async def update_item(
         stale_paths.add(old_image_original)
     if old_image_thumb and old_image_thumb != item.image_thumb:
         stale_paths.add(old_image_thumb)
-    for stale_path in stale_paths:
-        await _cleanup_media_if_unused(session, stale_path, exclude_item_id=item.id)
+    await cleanup_unreferenced_media(session, stale_paths)
 
     return ItemRead.model_validate(item)
 
@@ -230,7 +375,8 @@ async def delete_item(
     session: AsyncSession = Depends(get_session),
     current_user: User = Depends(get_current_user),
 ) -> None:
-    item = await session.get(Item, item_id)
+    # 锁定物料行，删除流水记录的是删除时的实际数量
+    item = await session.get(Item, item_id, with_for_update=True)
     if not item:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="物料不存在")
 
@@ -238,6 +384,8 @@ async def delete_item(
     table_id = item.table_id
     old_image_original = item.image_original
     old_image_thumb = item.image_thumb
+    bump_table_version(session, table_id)
+    movement = movement_row(item, -item.quantity, "item_delete", current_user.id, quantity_after=0)
     await session.delete(item)
     await log_operation(
         session=session,
@@ -247,8 +395,8 @@ async def delete_item(
         detail={"item_id": str(item_id), "table_id": str(table_id)},
         operator_id=current_user.id,
     )
+    await record_movements(session, [movement])
+    await publish_events(session, [deleted_item_event(item_id, table_id, code)])
     await session.commit()
 
-    stale_paths = {path for path in (old_image_original, old_image_thumb) if path}
-    for stale_path in stale_paths:
-        await _cleanup_media_if_unused(session, stale_path)
+    await cleanup_unreferenced_media(session, (old_image_original, old_image_thumb))
@@ -0,0 +1,51 @@
+from pathlib import Path
+from typing import Literal
+
+from fastapi import APIRouter, HTTPException, Query, status
+from fastapi.responses import FileResponse
+from PIL import features
+
+from app.core.config import settings
+from app.services.image_processing import render_variant
+from app.services.media_store import resolve_media_path
+from app.services.media_variants import VARIANT_FORMATS, VARIANT_WIDTHS, variant_cache, variant_path
+
+router = APIRouter(tags=["media"])
+SOURCE_DIRS = {"originals", "thumbs"}
+
+
+@router.get("/media-variants/{path:path}")
+async def get_media_variant(
+    path: str,
+    w: int = Query(description="目标宽度，可选 64 / 150 / 300 / 600 / 1200"),
+    variant_format: Literal["jpeg", "webp", "avif"] = Query(default="webp", alias="format"),
+) -> FileResponse:
+    # 与 /media 一样不做鉴权，供 <img> 直接引用
+    if w not in VARIANT_WIDTHS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="不支持的图片宽度")
+    if variant_format == "avif" and not features.check("avif"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="当前环境不支持 AVIF")
+
+    source = resolve_media_path(path)
+    if not source:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="图片不存在")
+    relative_path = source.relative_to(Path(settings.images_dir).resolve()).as_posix()
+    if relative_path.split("/", 1)[0] not in SOURCE_DIRS or not source.is_file():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="图片不存在")
+
+    pillow_format, media_type, _ = VARIANT_FORMATS[variant_format]
+    target = variant_path(relative_path, w, variant_format)
+    if target.exists():
+        variant_cache.touch(target)
+    else:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if not await render_variant(source, target, w, pillow_format):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="无法识别或处理该图片")
+        await variant_cache.record(target)
+
+    # 原图按内容哈希命名、不会被覆盖，变体可以长期缓存
+    return FileResponse(
+        target,
+        media_type=media_type,
+        headers={"Cache-Control": "public, max-age=31536000, immutable"},
+    )
@@ -1,110 +1,419 @@
-﻿from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import select
-from sqlalchemy.exc import IntegrityError
+﻿import json
+import uuid
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import func, select, text, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.database import get_session
 from app.deps import get_current_user
-from app.models import InventoryTable, Item, User
-from app.schemas import ItemRead, StockInRequest, StockOutRequest
-from app.services.logs import log_operation
+from app.models import InventoryTable, Item, StockMovement, User, as_utc, now_utc
+from app.schemas import (
+    ItemRead,
+    StockBatchLineError,
+    StockBatchRequest,
+    StockBatchResponse,
+    StockInRequest,
+    StockMovementPage,
+    StockMovementRead,
+    StockOutRequest,
+    StockTurnoverRow,
+)
+from app.services.change_versions import bump_table_version
+from app.services.events import item_event, publish_events
+from app.services.logs import build_log_detail, log_operation
+from app.services.pagination import decode_cursor, encode_cursor
+from app.services.stock_movements import movement_row, record_movements
 
 router = APIRouter(prefix="/stock", tags=["stock"])
 DEFAULT_SCANNED_NAME = "NUM"
 
 
+# 入库快路径：upsert + 数量累加 + 审计日志 + 库存流水合并为一条语句，
+# 并发扫描同一个新编码时由 ON CONFLICT 串行化，不再走 IntegrityError 重试
+# 表格 change_version（ETag）由 bump_table_version 在提交前递增，语句本身不锁表格行
+_STOCK_IN_SQL = text(
+    """
+    WITH target_table AS (
+      SELECT id, name FROM inventory_tables WHERE id = CAST(:table_id AS UUID)
+    ),
+    upserted AS (
+      INSERT INTO items (id, table_id, name, code, quantity, notes, properties, updated_at)
+      SELECT CAST(:item_id AS UUID), t.id, CAST(:name AS VARCHAR), CAST(:code AS VARCHAR),
+             CAST(:quantity AS INTEGER), CAST(:notes AS TEXT), CAST(:properties AS JSONB),
+             CAST(:now AS TIMESTAMPTZ)
+      FROM target_table t
+      ON CONFLICT (table_id, code) DO UPDATE SET
+        quantity = items.quantity + EXCLUDED.quantity,
+        name = CASE WHEN CAST(:rename AS BOOLEAN) THEN EXCLUDED.name ELSE items.name END,
+        notes = COALESCE(CAST(:notes AS TEXT), items.notes),
+        properties = items.properties || EXCLUDED.properties,
+        updated_at = EXCLUDED.updated_at
+      RETURNING items.*
+    ),
+    logged AS (
+      INSERT INTO operation_logs (id, operator_id, action, target, summary, detail, created_at)
+      SELECT CAST(:log_id AS UUID), CAST(:operator_id AS UUID), 'stock_in', u.code,
+             CAST(:summary_prefix AS VARCHAR) || t.name,
+             CAST(:log_detail AS JSONB) || jsonb_build_object('item_id', u.id::text, 'table_id', u.table_id::text),
+             CAST(:now AS TIMESTAMPTZ)
+      FROM upserted u CROSS JOIN target_table t
+    ),
+    moved AS (
+      INSERT INTO stock_movements (id, item_id, table_id, code, delta, quantity_after, operator_id, source, created_at)
+      SELECT CAST(:movement_id AS UUID), u.id, u.table_id, u.code, CAST(:quantity AS INTEGER), u.quantity,
+             CAST(:operator_id AS UUID), 'stock_in', CAST(:now AS TIMESTAMPTZ)
+      FROM upserted u
+    )
+    SELECT u.* FROM upserted u
+    """
+)
+
+
 @router.post("/in", response_model=ItemRead)
 async def stock_in(
     payload: StockInRequest,
     session: AsyncSession = Depends(get_session),
     current_user: User = Depends(get_current_user),
 ) -> ItemRead:
-    table = await session.get(InventoryTable, payload.table_id)
-    if not table:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="表格不存在")
-
     code = payload.code.strip()
     if not code:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="编码不能为空")
 
-    stmt = select(Item).where(Item.table_id == payload.table_id, Item.code == code).with_for_update()
-    result = await session.execute(stmt)
+    name = payload.name.strip() if payload.name and payload.name.strip() else ""
+    result = await session.execute(
+        select(Item).from_statement(_STOCK_IN_SQL),
+        {
+            "table_id": payload.table_id,
+            "item_id": uuid.uuid4(),
+            "name": name or DEFAULT_SCANNED_NAME,
+            "rename": bool(name),
+            "code": code,
+            "quantity": payload.quantity,
+            "notes": payload.notes or None,
+            "properties": json.dumps(payload.properties or {}, ensure_ascii=False),
+            "now": now_utc(),
+            "log_id": uuid.uuid4(),
+            "movement_id": uuid.uuid4(),
+            "operator_id": current_user.id,
+            "summary_prefix": f"Stock in {payload.quantity} for {code} in table ",
+            "log_detail": json.dumps(build_log_detail({"quantity": payload.quantity}), ensure_ascii=False),
+        },
+    )
     item = result.scalar_one_or_none()
-
     if not item:
-        default_name = payload.name.strip() if payload.name and payload.name.strip() else DEFAULT_SCANNED_NAME
-        item = Item(
-            table_id=payload.table_id,
-            name=default_name,
-            code=code,
-            quantity=payload.quantity,
-            notes=payload.notes,
-            properties=payload.properties or {},
-        )
-        session.add(item)
-    else:
-        item.quantity = int(item.quantity) + int(payload.quantity)
-        if payload.name and payload.name.strip():
-            item.name = payload.name.strip()
-        if payload.notes:
-            item.notes = payload.notes
-        if payload.properties:
-            item.properties = {**(item.properties or {}), **payload.properties}
-
-    try:
-        await session.flush()
-    except IntegrityError:
         await session.rollback()
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="入库失败，编码可能重复") from None
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="表格不存在")
 
-    await log_operation(
-        session=session,
-        action="stock_in",
-        target=item.code,
-        summary=f"Stock in {payload.quantity} for {item.code} in table {table.name}",
-        detail={"item_id": str(item.id), "table_id": str(item.table_id), "quantity": payload.quantity},
-        operator_id=current_user.id,
-    )
+    bump_table_version(session, item.table_id)
+    await publish_events(session, [item_event("stock_in", item)])
     await session.commit()
-    await session.refresh(item)
     return ItemRead.model_validate(item)
 
 
+# 出库快路径：库存校验放进 UPDATE 的 WHERE 条件，不再 SELECT ... FOR UPDATE 后回写，
+# 行锁只在这一条语句到提交之间持有
+_STOCK_OUT_SQL = text(
+    """
+    WITH target_table AS (
+      SELECT id, name FROM inventory_tables WHERE id = CAST(:table_id AS UUID)
+    ),
+    updated AS (
+      UPDATE items SET
+        quantity = items.quantity - CAST(:quantity AS INTEGER),
+        notes = COALESCE(CAST(:notes AS TEXT), items.notes),
+        updated_at = CAST(:now AS TIMESTAMPTZ)
+      FROM target_table t
+      WHERE items.table_id = t.id
+        AND items.code = CAST(:code AS VARCHAR)
+        AND items.quantity >= CAST(:quantity AS INTEGER)
+      RETURNING items.*
+    ),
+    logged AS (
+      INSERT INTO operation_logs (id, operator_id, action, target, summary, detail, created_at)
+      SELECT CAST(:log_id AS UUID), CAST(:operator_id AS UUID), 'stock_out', u.code,
+             CAST(:summary_prefix AS VARCHAR) || t.name,
+             CAST(:log_detail AS JSONB) || jsonb_build_object('item_id', u.id::text, 'table_id', u.table_id::text),
+             CAST(:now AS TIMESTAMPTZ)
+      FROM updated u CROSS JOIN target_table t
+    ),
+    moved AS (
+      INSERT INTO stock_movements (id, item_id, table_id, code, delta, quantity_after, operator_id, source, created_at)
+      SELECT CAST(:movement_id AS UUID), u.id, u.table_id, u.code, -CAST(:quantity AS INTEGER), u.quantity,
+             CAST(:operator_id AS UUID), 'stock_out', CAST(:now AS TIMESTAMPTZ)
+      FROM updated u
+    )
+    SELECT u.* FROM updated u
+    """
+)
+
+
 @router.post("/out", response_model=ItemRead)
 async def stock_out(
     payload: StockOutRequest,
     session: AsyncSession = Depends(get_session),
     current_user: User = Depends(get_current_user),
 ) -> ItemRead:
-    table = await session.get(InventoryTable, payload.table_id)
-    if not table:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="表格不存在")
-
     code = payload.code.strip()
     if not code:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="编码不能为空")
 
-    stmt = select(Item).where(Item.table_id == payload.table_id, Item.code == code).with_for_update()
-    result = await session.execute(stmt)
+    result = await session.execute(
+        select(Item).from_statement(_STOCK_OUT_SQL),
+        {
+            "table_id": payload.table_id,
+            "code": code,
+            "quantity": payload.quantity,
+            "notes": payload.notes or None,
+            "now": now_utc(),
+            "log_id": uuid.uuid4(),
+            "movement_id": uuid.uuid4(),
+            "operator_id": current_user.id,
+            "summary_prefix": f"Stock out {payload.quantity} for {code} in table ",
+            "log_detail": json.dumps(build_log_detail({"quantity": payload.quantity}), ensure_ascii=False),
+        },
+    )
     item = result.scalar_one_or_none()
-    if not item:
+    if item:
+        bump_table_version(session, item.table_id)
+        await publish_events(session, [item_event("stock_out", item)])
+        await session.commit()
+        return ItemRead.model_validate(item)
+
+    # 未更新到行时再区分原因，只在失败路径多一次查询
+    await session.rollback()
+    table = await session.get(InventoryTable, payload.table_id)
+    if not table:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="表格不存在")
+    quantity_result = await session.execute(
+        select(Item.quantity).where(Item.table_id == payload.table_id, Item.code == code)
+    )
+    current_quantity = quantity_result.scalar_one_or_none()
+    if current_quantity is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="物料不存在")
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"库存不足，当前库存 {current_quantity}")
+
 
-    if item.quantity < payload.quantity:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"库存不足，当前库存 {item.quantity}")
+async def _lock_items(session: AsyncSession, table_id: uuid.UUID, codes: list[str]) -> dict[str, Item]:
+    if not codes:
+        return {}
+    stmt = (
+        select(Item)
+        .where(Item.table_id == table_id, Item.code.in_(codes))
+        .order_by(Item.code)
+        .with_for_update()
+    )
+    result = await session.execute(stmt)
+    return {item.code: item for item in result.scalars().all()}
 
-    item.quantity = int(item.quantity) - int(payload.quantity)
-    if payload.notes:
-        item.notes = payload.notes
 
+@router.post("/batch", response_model=StockBatchResponse)
+async def stock_batch(
+    payload: StockBatchRequest,
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user),
+) -> StockBatchResponse:
+    table = await session.get(InventoryTable, payload.table_id)
+    if not table:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="表格不存在")
+
+    bump_table_version(session, table.id)
+    codes = sorted({line.code.strip() for line in payload.lines if line.code.strip()})
+    # 按编码排序一次性加锁，多个批次并发时加锁顺序一致，避免死锁
+    items_by_code = await _lock_items(session, payload.table_id, codes)
+
+    # 新编码同样按排序后的顺序 INSERT ... ON CONFLICT DO NOTHING 建档，再像已有物料一样加锁；
+    # 并发批次创建同一编码时由唯一索引串行化，不会抛出 IntegrityError
+    new_names: dict[str, str] = {}
+    for line in payload.lines:
+        code = line.code.strip()
+        if code and line.direction == "in" and code not in items_by_code and code not in new_names:
+            new_names[code] = line.name.strip() if line.name and line.name.strip() else DEFAULT_SCANNED_NAME
+    if new_names:
+        now = now_utc()
+        await session.execute(
+            pg_insert(Item)
+            .values(
+                [
+                    {
+                        "id": uuid.uuid4(),
+                        "table_id": payload.table_id,
+                        "name": new_names[code],
+                        "code": code,
+                        "quantity": 0,
+                        "properties": {},
+                        "updated_at": now,
+                    }
+                    for code in sorted(new_names)
+                ]
+            )
+            .on_conflict_do_nothing(index_elements=[Item.table_id, Item.code])
+        )
+        items_by_code.update(await _lock_items(session, payload.table_id, sorted(new_names)))
+
+    errors: list[StockBatchLineError] = []
+    deltas: dict[str, int] = {}
+    # 出库明细早于同编码的首条入库明细时，与逐条执行一致，按物料不存在处理
+    unseen_new = set(new_names)
+    for index, line in enumerate(payload.lines):
+        code = line.code.strip()
+        if not code:
+            errors.append(StockBatchLineError(index=index, code=line.code, detail="编码不能为空"))
+            continue
+
+        item = items_by_code.get(code)
+        if line.direction == "in":
+            if not item:
+                # 建档后、加锁前被并发删除
+                errors.append(StockBatchLineError(index=index, code=code, detail="物料不存在"))
+                continue
+            unseen_new.discard(code)
+            if line.name and line.name.strip():
+                item.name = line.name.strip()
+            if line.properties:
+                item.properties = {**(item.properties or {}), **line.properties}
+            item.quantity = int(item.quantity or 0) + int(line.quantity)
+            deltas[code] = deltas.get(code, 0) + int(line.quantity)
+        else:
+            if not item or code in unseen_new:
+                errors.append(StockBatchLineError(index=index, code=code, detail="物料不存在"))
+                continue
+            if item.quantity < line.quantity:
+                errors.append(
+                    StockBatchLineError(index=index, code=code, detail=f"库存不足，当前库存 {item.quantity}")
+                )
+                continue
+            item.quantity = int(item.quantity) - int(line.quantity)
+            deltas[code] = deltas.get(code, 0) - int(line.quantity)
+        if line.notes:
+            item.notes = line.notes
+
+    if errors and not payload.allow_partial:
+        await session.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={
+                "code": "STOCK_BATCH_FAILED",
+                "message": "部分明细无法执行，整批未提交",
+                "errors": [error.model_dump() for error in errors],
+            },
+        )
+
+    await session.flush()
+
+    applied = len(payload.lines) - len(errors)
+    touched = [items_by_code[code] for code in sorted(deltas)]
     await log_operation(
         session=session,
-        action="stock_out",
-        target=item.code,
-        summary=f"Stock out {payload.quantity} for {item.code} in table {table.name}",
-        detail={"item_id": str(item.id), "table_id": str(item.table_id), "quantity": payload.quantity},
+        action="stock_batch",
+        target=table.name,
+        summary=f"Stock batch {applied} lines in table {table.name}",
+        detail={
+            "table_id": str(table.id),
+            "applied": applied,
+            "failed": len(errors),
+            "changes": [{"item_id": str(item.id), "code": item.code, "delta": deltas[item.code]} for item in touched],
+        },
         operator_id=current_user.id,
     )
+    await record_movements(
+        session,
+        [movement_row(item, deltas[item.code], "stock_batch", current_user.id) for item in touched],
+    )
+    await publish_events(session, [item_event("stock_batch", item) for item in touched])
     await session.commit()
-    await session.refresh(item)
-    return ItemRead.model_validate(item)
+    return StockBatchResponse(
+        applied=applied,
+        items=[ItemRead.model_validate(item) for item in touched],
+        errors=errors,
+    )
+
+
+@router.get("/movements", response_model=StockMovementPage)
+async def list_stock_movements(
+    item_id: uuid.UUID | None = Query(default=None, description="按物料查询流水"),
+    table_id: uuid.UUID | None = Query(default=None, description="按表格查询流水"),
+    start: datetime | None = Query(default=None, description="起始时间（含）"),
+    end: datetime | None = Query(default=None, description="结束时间（不含）"),
+    limit: int = Query(default=100, ge=1, le=500),
+    cursor: str | None = Query(default=None, description="上一页返回的 next_cursor"),
+    session: AsyncSession = Depends(get_session),
+    _: User = Depends(get_current_user),
+) -> StockMovementPage:
+    if not item_id and not table_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="请指定 item_id 或 table_id")
+
+    # (item_id|table_id, created_at, id) 索引上的范围扫描，按 keyset 倒序翻页
+    stmt = select(StockMovement)
+    if item_id:
+        stmt = stmt.where(StockMovement.item_id == item_id)
+    if table_id:
+        stmt = stmt.where(StockMovement.table_id == table_id)
+    if start:
+        stmt = stmt.where(StockMovement.created_at >= as_utc(start))
+    if end:
+        stmt = stmt.where(StockMovement.created_at < as_utc(end))
+    if cursor:
+        cursor_created_at, cursor_id = decode_cursor(cursor)
+        stmt = stmt.where(
+            tuple_(StockMovement.created_at, StockMovement.id)
+            < tuple_(cursor_created_at, cursor_id, types=[StockMovement.created_at.type, StockMovement.id.type])
+        )
+    stmt = stmt.order_by(StockMovement.created_at.desc(), StockMovement.id.desc()).limit(limit + 1)
+
+    result = await session.execute(stmt)
+    rows = list(result.scalars().all())
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return StockMovementPage(
+        movements=[StockMovementRead.model_validate(row) for row in rows],
+        next_cursor=next_cursor,
+    )
+
+
+@router.get("/turnover", response_model=list[StockTurnoverRow])
+async def get_stock_turnover(
+    table_id: uuid.UUID = Query(description="表格 ID"),
+    start: datetime = Query(description="起始时间（含）"),
+    end: datetime | None = Query(default=None, description="结束时间（不含），默认当前时间"),
+    limit: int = Query(default=100, ge=1, le=1000),
+    session: AsyncSession = Depends(get_session),
+    _: User = Depends(get_current_user),
+) -> list[StockTurnoverRow]:
+    # 期间内按物料汇总出入库量，只扫描 ix_stock_movements_table_created_id 上的时间范围
+    inbound = func.coalesce(func.sum(StockMovement.delta).filter(StockMovement.delta > 0), 0)
+    outbound = func.coalesce(-func.sum(StockMovement.delta).filter(StockMovement.delta < 0), 0)
+    stmt = (
+        select(
+            StockMovement.item_id,
+            func.max(StockMovement.code).label("code"),
+            inbound.label("inbound"),
+            outbound.label("outbound"),
+            func.sum(StockMovement.delta).label("net"),
+            func.count().label("movements"),
+        )
+        .where(
+            StockMovement.table_id == table_id,
+            StockMovement.created_at >= as_utc(start),
+            StockMovement.created_at < as_utc(end) if end else StockMovement.created_at <= now_utc(),
+        )
+        .group_by(StockMovement.item_id)
+        .order_by(outbound.desc(), StockMovement.item_id)
+        .limit(limit)
+    )
+    result = await session.execute(stmt)
+    return [
+        StockTurnoverRow(
+            item_id=row.item_id,
+            code=row.code,
+            inbound=int(row.inbound),
+            outbound=int(row.outbound),
+            net=int(row.net),
+            movements=int(row.movements),
+        )
+        for row in result.all()
+    ]
@@ -16,6 +16,13 @@ from app.core.database import get_session
 from app.deps import require_admin
 from app.models import User
 from app.services.logs import log_operation
+from app.services.media_gc import (
+    collect_orphan_media,
+    get_media_gc_job,
+    media_gc_running,
+    running_media_gc_job,
+    start_media_gc_job,
+)
 
 router = APIRouter(prefix="/system", tags=["system"])
 
@@ -410,6 +417,7 @@ async def set_tailscale_config(
         summary=f"Update tailscale config ({apply_result})",
         detail={"applied": payload.apply},
         operator_id=current_user.id,
+        durable=True,
     )
     await session.commit()
 
@@ -451,6 +459,7 @@ async def set_repo_config(
         summary="Update repository config",
         detail={"repo_url": repo_url, "branch": branch, "initialized": initialized},
         operator_id=current_user.id,
+        durable=True,
     )
     await session.commit()
 
@@ -601,6 +610,7 @@ async def apply_update(
         summary="Start web update task",
         detail={"task_id": task_id},
         operator_id=current_user.id,
+        durable=True,
     )
     await session.commit()
 
@@ -718,6 +728,7 @@ async def rollback_version(
         summary=f"Start rollback to {ref}",
         detail={"task_id": task_id, "ref": ref},
         operator_id=current_user.id,
+        durable=True,
     )
     await session.commit()
 
@@ -765,6 +776,7 @@ async def rollback_latest_version(
         summary=f"Start rollback to latest {latest_ref}",
         detail={"task_id": task_id, "ref": latest_ref},
         operator_id=current_user.id,
+        durable=True,
     )
     await session.commit()
 
@@ -775,3 +787,34 @@ async def rollback_latest_version(
         log_path=str(log_path),
     )
 
+
+@router.get("/media-gc/report")
+async def get_media_gc_report(_: User = Depends(require_admin)) -> dict[str, Any]:
+    # 只统计不删除：列出超过宽限期且未被任何物料引用的图片文件
+    report = await collect_orphan_media(dry_run=True)
+    return report.as_dict()
+
+
+@router.post("/media-gc/run", status_code=status.HTTP_202_ACCEPTED)
+async def run_media_gc(current_user: User = Depends(require_admin)) -> dict[str, Any]:
+    # 限速清理在后台执行，接口立即返回任务信息，进度通过 /system/media-gc/jobs/{job_id} 查询
+    running_job = running_media_gc_job()
+    if running_job or media_gc_running():
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={
+                "code": "MEDIA_GC_RUNNING",
+                "message": "孤立图片清理正在进行中",
+                "job_id": running_job.id if running_job else None,
+            },
+        )
+    job = start_media_gc_job(current_user.id)
+    return job.as_dict()
+
+
+@router.get("/media-gc/jobs/{job_id}")
+async def get_media_gc_job_status(job_id: str, _: User = Depends(require_admin)) -> dict[str, Any]:
+    job = get_media_gc_job(job_id)
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="清理任务不存在")
+    return job.as_dict()
@@ -1,16 +1,45 @@
 ﻿import uuid
+from typing import Literal
+from urllib.parse import quote
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy import delete, func, select
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, Response, UploadFile, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
 from app.core.database import get_session
 from app.deps import get_current_user
-from app.models import InventoryTable, Item, User
-from app.routers.items import _cleanup_media_if_unused
+from app.models import InventoryTable, User
+from app.schemas import ItemImportResponse
+from app.services.change_versions import (
+    apply_etag,
+    bump_table_version,
+    current_etag,
+    is_not_modified,
+    next_change_version,
+    not_modified_response,
+)
+from app.services.events import publish_events, table_event
+from app.services.item_export import schema_field_columns, stream_table_items
+from app.services.item_import import import_items_csv
 from app.services.logs import log_operation
+from app.services.table_purge import (
+    INLINE_PURGE_LIMIT,
+    delete_table_now,
+    get_purge_job,
+    running_purge_job,
+    start_purge_job,
+)
+from app.services.table_stats import (
+    load_table_stats,
+    low_stock_threshold,
+    refresh_low_stock_flags,
+    schema_low_stock_threshold,
+    stats_response,
+    table_item_count,
+)
 
 router = APIRouter(prefix="/tables", tags=["tables"])
 
@@ -27,12 +56,93 @@ def table_response(table: InventoryTable) -> dict:
 
 @router.get("")
 async def list_tables(
+    request: Request,
+    response: Response,
+    include_stats: bool = Query(default=False, description="同时返回每个表格的物料统计"),
     session: AsyncSession = Depends(get_session),
     _: User = Depends(get_current_user),
 ) -> list[dict]:
+    # 物料写入都会递增所属表格的 change_version，统计变化同样会让 ETag 失效
+    etag = await current_etag(request, session)
+    if etag and is_not_modified(request, etag):
+        return not_modified_response(etag)
+
     result = await session.execute(select(InventoryTable).order_by(InventoryTable.updated_at.desc()))
     rows = list(result.scalars().all())
-    return [table_response(row) for row in rows]
+    apply_etag(response, etag)
+    if not include_stats:
+        return [table_response(row) for row in rows]
+
+    stats_map = await load_table_stats(session, [row.id for row in rows])
+    return [{**table_response(row), "stats": stats_response(row.id, stats_map.get(row.id))} for row in rows]
+
+
+@router.get("/{table_id}/stats")
+async def get_table_stats(
+    table_id: uuid.UUID,
+    session: AsyncSession = Depends(get_session),
+    _: User = Depends(get_current_user),
+) -> dict:
+    table = await session.get(InventoryTable, table_id)
+    if not table:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="表格不存在")
+    stats_map = await load_table_stats(session, [table_id])
+    return stats_response(table_id, stats_map.get(table_id))
+
+
+@router.get("/{table_id}/export")
+async def export_table_items(
+    table_id: uuid.UUID,
+    export_format: Literal["csv", "ndjson"] = Query(default="csv", alias="format", description="csv 或 ndjson"),
+    session: AsyncSession = Depends(get_session),
+    _: User = Depends(get_current_user),
+) -> StreamingResponse:
+    table = await session.get(InventoryTable, table_id)
+    if not table:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="表格不存在")
+
+    media_type = "text/csv; charset=utf-8" if export_format == "csv" else "application/x-ndjson"
+    filename = f"{table.name}.{export_format}"
+    return StreamingResponse(
+        stream_table_items(table.id, export_format, schema_field_columns(table)),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}"},
+    )
+
+
+@router.post("/{table_id}/import", response_model=ItemImportResponse)
+async def import_table_items(
+    table_id: uuid.UUID,
+    file: UploadFile = File(...),
+    quantity_mode: Literal["set", "add"] = Query(default="set", description="set 覆盖数量，add 在现有数量上累加"),
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user),
+) -> ItemImportResponse:
+    table = await session.get(InventoryTable, table_id)
+    if not table:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="表格不存在")
+
+    bump_table_version(session, table.id)
+    report = await import_items_csv(session, table, file, quantity_mode, current_user.id)
+    await log_operation(
+        session=session,
+        action="import_items",
+        target=table.name,
+        summary=f"Import {report['inserted'] + report['updated']} items into table {table.name}",
+        detail={
+            "table_id": str(table.id),
+            "filename": file.filename,
+            "quantity_mode": quantity_mode,
+            "total_rows": report["total_rows"],
+            "inserted": report["inserted"],
+            "updated": report["updated"],
+            "failed": report["failed"],
+        },
+        operator_id=current_user.id,
+    )
+    await publish_events(session, [table_event("imported", table.id)])
+    await session.commit()
+    return ItemImportResponse(**report)
 
 
 @router.post("", status_code=status.HTTP_201_CREATED)
@@ -49,7 +159,7 @@ async def create_table(
     if not isinstance(schema_data, dict):
         schema_data = {"fields": []}
 
-    table = InventoryTable(name=name, schema=schema_data)
+    table = InventoryTable(name=name, schema=schema_data, change_version=next_change_version())
     session.add(table)
     try:
         await session.flush()
@@ -65,6 +175,7 @@ async def create_table(
         detail={"table_id": str(table.id)},
         operator_id=current_user.id,
     )
+    await publish_events(session, [table_event("created", table.id)])
     await session.commit()
     await session.refresh(table)
     return table_response(table)
@@ -81,15 +192,25 @@ async def update_table(
     if not table:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="表格不存在")
 
+    updated_name = None
     if payload.get("name") is not None:
         updated_name = str(payload.get("name")).strip()
         if not updated_name:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="表格名称不能为空")
+    schema_data = payload.get("schema")
+    if schema_data is not None and not isinstance(schema_data, dict):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="schema 必须是对象")
+
+    # 先刷新物料标记、再改表格行：与物料写入同样先锁物料后锁表格，避免互相死锁
+    if schema_data is not None:
+        threshold = schema_low_stock_threshold(schema_data)
+        if threshold != low_stock_threshold(table):
+            await refresh_low_stock_flags(session, table.id, threshold)
+    if updated_name is not None:
         table.name = updated_name
-    if payload.get("schema") is not None:
-        if not isinstance(payload.get("schema"), dict):
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="schema 必须是对象")
-        table.schema = payload.get("schema")
+    if schema_data is not None:
+        table.schema = schema_data
+    bump_table_version(session, table.id)
 
     try:
         await session.flush()
@@ -105,25 +226,36 @@ async def update_table(
         detail={"table_id": str(table.id), "schema_fields": len(table.schema.get('fields', []))},
         operator_id=current_user.id,
     )
+    await publish_events(session, [table_event("updated", table.id)])
     await session.commit()
     await session.refresh(table)
     return table_response(table)
 
 
-@router.delete("/{table_id}", status_code=status.HTTP_204_NO_CONTENT)
+@router.delete("/{table_id}", status_code=status.HTTP_204_NO_CONTENT, response_model=None)
 async def delete_table(
     table_id: uuid.UUID,
     purge_items: bool = Query(default=False, description="是否同时删除该表下所有物料"),
     session: AsyncSession = Depends(get_session),
     current_user: User = Depends(get_current_user),
-) -> None:
+) -> Response | None:
     table = await session.get(InventoryTable, table_id)
     if not table:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="表格不存在")
 
-    count_stmt = select(func.count(Item.id)).where(Item.table_id == table_id)
-    count_result = await session.execute(count_stmt)
-    items_count = int(count_result.scalar_one() or 0)
+    running_job = running_purge_job(table_id)
+    if running_job:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={
+                "code": "TABLE_PURGE_RUNNING",
+                "message": "该表正在后台删除中",
+                "job_id": running_job.id,
+            },
+        )
+
+    # 计数来自触发器维护的统计行；删除期间并发写入的物料由外键约束兜底，见 delete_table_now
+    items_count = await table_item_count(session, table_id)
 
     if items_count > 0 and not purge_items:
         raise HTTPException(
@@ -135,35 +267,22 @@ async def delete_table(
             },
         )
 
-    if items_count > 0 and purge_items:
-        # BUG-04: 删除前先收集所有物料的图片路径，删除后逐个清理磁盘文件
-        img_stmt = select(Item.image_original, Item.image_thumb).where(Item.table_id == table_id)
-        img_result = await session.execute(img_stmt)
-        stale_paths: set[str] = set()
-        for row in img_result.all():
-            if row.image_original:
-                stale_paths.add(row.image_original)
-            if row.image_thumb:
-                stale_paths.add(row.image_thumb)
-
-        delete_result = await session.execute(delete(Item).where(Item.table_id == table_id))
-        deleted_items = int(delete_result.rowcount or 0)
-    else:
-        deleted_items = 0
-        stale_paths = set()
-
-    table_name = table.name
-    await session.delete(table)
-    await log_operation(
-        session=session,
-        action="delete_table",
-        target=table_name,
-        summary=f"Delete table {table_name}",
-        detail={"table_id": str(table_id), "purge_items": purge_items, "deleted_items": deleted_items},
-        operator_id=current_user.id,
-    )
-    await session.commit()
+    if purge_items and items_count > INLINE_PURGE_LIMIT:
+        # 大表改为后台分批删除，接口立即返回任务信息，进度通过 /tables/purge-jobs/{job_id} 查询
+        await session.rollback()
+        job = start_purge_job(table, items_count, current_user.id)
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=job.as_dict())
+
+    await delete_table_now(session, table, current_user.id, purge_items and items_count > 0)
+    return None
 
-    # BUG-04: 提交后清理孤立图片文件
-    for stale_path in stale_paths:
-        await _cleanup_media_if_unused(session, stale_path)
+
+@router.get("/purge-jobs/{job_id}")
+async def get_table_purge_job(
+    job_id: str,
+    _: User = Depends(get_current_user),
+) -> dict:
+    job = get_purge_job(job_id)
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="删除任务不存在")
+    return job.as_dict()
@@ -1,75 +1,104 @@
-import io
-import uuid
+from functools import partial
 from pathlib import Path
 
-from fastapi import APIRouter, Depends, File, HTTPException, Request, UploadFile, status
-from PIL import Image, UnidentifiedImageError
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile, status
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
+from app.core.database import get_session
 from app.deps import get_current_user
 from app.models import User
-from app.schemas import UploadResponse
+from app.schemas import UploadResponse, UploadStatusResponse
+from app.services.image_processing import render_thumbnail, schedule_thumbnail, thumbnail_status
+from app.services.media_store import (
+    content_paths,
+    discard_failed_original,
+    find_original_by_hash,
+    register_upload,
+    resolve_media_path,
+    stage_upload,
+)
 
 router = APIRouter(tags=["upload"])
 ALLOWED_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp", ".heic", ".heif"}
 MAX_UPLOAD_SIZE = 30 * 1024 * 1024  # 30MB，与 nginx 保持一致
 
-try:
-    from pillow_heif import register_heif_opener
-
-    register_heif_opener()
-except Exception:
-    # 兼容未安装 heif 扩展的场景，常规格式仍可正常上传
-    pass
-
 
 @router.post("/upload", response_model=UploadResponse, status_code=status.HTTP_201_CREATED)
 async def upload_image(
     request: Request,
     file: UploadFile = File(...),
+    async_thumbnail: bool = Query(default=False, description="立即返回，缩略图在后台生成"),
+    session: AsyncSession = Depends(get_session),
     _: User = Depends(get_current_user),
 ) -> UploadResponse:
     if not file.content_type or not file.content_type.startswith("image/"):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="仅支持图片上传")
 
-    file_bytes = await file.read()
-    if not file_bytes:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="上传文件为空")
-    # BUG-09: 限制上传大小，防止绕过 nginx 直接访问后端 OOM
-    if len(file_bytes) > MAX_UPLOAD_SIZE:
-        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="文件大小超过 30MB 限制")
+    # BUG-09: 限制上传大小，防止绕过 nginx 直接访问后端 OOM；超限时边写边中止
+    staged = await stage_upload(file, MAX_UPLOAD_SIZE, "文件大小超过 30MB 限制")
 
     suffix = Path(file.filename or "").suffix.lower()
     if suffix not in ALLOWED_EXTS:
         suffix = ".jpg"
 
-    file_id = uuid.uuid4().hex
-    original_rel = Path("originals") / f"{file_id}{suffix}"
-    thumb_rel = Path("thumbs") / f"{file_id}.jpg"
+    # 按内容哈希存储：相同图片再次上传时直接复用已有原图与缩略图
+    original_path, thumb_path = content_paths(staged.sha256, suffix)
+    existing_path = await find_original_by_hash(session, staged.sha256)
+    existing_abs = resolve_media_path(existing_path) if existing_path else None
+    created_original = False
+    if existing_path and existing_abs and existing_abs.exists():
+        staged.path.unlink(missing_ok=True)
+        original_path = existing_path
+        original_abs = existing_abs
+    else:
+        original_abs = Path(settings.images_dir) / original_path
+        original_abs.parent.mkdir(parents=True, exist_ok=True)
+        # 临时文件与原图在同一目录树下，改名即落盘，不再复制内容
+        staged.path.replace(original_abs)
+        created_original = True
 
-    original_abs = Path(settings.images_dir) / original_rel
-    thumb_abs = Path(settings.images_dir) / thumb_rel
-    original_abs.parent.mkdir(parents=True, exist_ok=True)
+    thumb_abs = Path(settings.images_dir) / thumb_path
     thumb_abs.parent.mkdir(parents=True, exist_ok=True)
-    original_abs.write_bytes(file_bytes)
 
+    # 解码与缩略图在进程池中完成；async_thumbnail 时不等待结果，缩略图稍后出现在 thumb_path。
+    # 后台任务在登记提交之后才调度：失败清理时能看到登记行，在同一把行锁下按引用数删行并删除原图
+    thumb_pending = False
+    needs_thumbnail = not thumb_abs.exists()
     try:
-        with Image.open(io.BytesIO(file_bytes)) as img:
-            if img.mode not in ("RGB", "L"):
-                img = img.convert("RGB")
-            img.thumbnail((300, 300))
-            if img.mode != "RGB":
-                img = img.convert("RGB")
-            img.save(thumb_abs, format="JPEG", quality=85, optimize=True)
-    except (UnidentifiedImageError, OSError):
-        original_abs.unlink(missing_ok=True)
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="无法识别或处理该图片") from None
+        if needs_thumbnail and not async_thumbnail and not await render_thumbnail(original_abs, thumb_abs):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="无法识别或处理该图片")
+
+        await register_upload(session, original_path, thumb_path, staged.sha256, staged.size)
+        await session.commit()
+
+        if needs_thumbnail and async_thumbnail:
+            schedule_thumbnail(original_abs, thumb_abs, partial(discard_failed_original, original_path))
+            thumb_pending = True
+    except HTTPException:
+        if created_original:
+            await discard_failed_original(original_path)
+        raise
 
-    original_path = original_rel.as_posix()
-    thumb_path = thumb_rel.as_posix()
     return UploadResponse(
         original_path=original_path,
         thumb_path=thumb_path,
         original_url=str(request.url_for("media", path=original_path)),
         thumb_url=str(request.url_for("media", path=thumb_path)),
+        thumb_pending=thumb_pending,
+        size=staged.size,
+        sha256=staged.sha256,
     )
+
+
+@router.get("/upload/status", response_model=UploadStatusResponse)
+async def upload_status(
+    original_path: str = Query(description="上传返回的 original_path"),
+    thumb_path: str = Query(description="上传返回的 thumb_path"),
+    _: User = Depends(get_current_user),
+) -> UploadStatusResponse:
+    original_abs = resolve_media_path(original_path)
+    thumb_abs = resolve_media_path(thumb_path)
+    if not original_abs or not thumb_abs:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="图片路径无效")
+    return UploadStatusResponse(status=thumbnail_status(original_abs, thumb_abs))
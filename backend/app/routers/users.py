@@ -7,7 +7,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.database import get_session
 from app.core.security import get_password_hash
-from app.deps import require_admin
+from app.deps import invalidate_cached_user, require_admin
 from app.models import User
 from app.schemas import UserCreateRequest, UserReadResponse
 from app.services.logs import log_operation
@@ -54,6 +54,7 @@ async def create_user(
         summary=f"Create account {user.username}",
         detail={"user_id": str(user.id), "role": user.role},
         operator_id=admin_user.id,
+        durable=True,
     )
     await session.commit()
     await session.refresh(user)
@@ -84,5 +85,7 @@ async def delete_user(
         summary=f"Delete account {username}",
         detail={"user_id": str(user_id)},
         operator_id=admin_user.id,
+        durable=True,
     )
     await session.commit()
+    invalidate_cached_user(user_id)
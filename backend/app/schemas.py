@@ -1,7 +1,7 @@
 ﻿import uuid
 from datetime import datetime
 from enum import Enum
-from typing import Any
+from typing import Annotated, Any, Literal
 
 from pydantic import BaseModel, Field
 
@@ -52,6 +52,7 @@ class ItemCreate(BaseModel):
     name: str
     code: str
     quantity: int = Field(default=0, ge=0)
+    reorder_level: int | None = Field(default=None, ge=0)
     image_original: str | None = None
     image_thumb: str | None = None
     notes: str | None = None
@@ -63,6 +64,7 @@ class ItemUpdate(BaseModel):
     code: str | None = None
     quantity: int | None = Field(default=None, ge=0)  # BUG-08: 禁止负值
     # BUG-01: 使用 _UNSET 哨兵值区分 "未提供" 和 "要清空"
+    reorder_level: Annotated[int, Field(ge=0)] | None | _Unset = _Unset.UNSET
     image_original: str | None | _Unset = _Unset.UNSET
     image_thumb: str | None | _Unset = _Unset.UNSET
     notes: str | None | _Unset = _Unset.UNSET
@@ -77,6 +79,8 @@ class ItemRead(BaseModel):
     name: str
     code: str
     quantity: int
+    reorder_level: int | None = None
+    is_low_stock: bool = False
     image_original: str | None
     image_thumb: str | None
     notes: str | None
@@ -86,11 +90,57 @@ class ItemRead(BaseModel):
     model_config = {"from_attributes": True}
 
 
+class ItemSearchHit(ItemRead):
+    score: float = 0.0
+
+
+class ItemPage(BaseModel):
+    items: list[ItemRead]
+    next_cursor: str | None = None
+
+
+class ItemChangeRead(BaseModel):
+    item_id: uuid.UUID
+    table_id: uuid.UUID
+    op: Literal["upsert", "delete"]
+    changed_at: datetime
+    item: ItemRead | None = None
+
+
+class ItemChangesPage(BaseModel):
+    changes: list[ItemChangeRead]
+    next_since: str | None = None
+    has_more: bool = False
+
+
+class ItemImportError(BaseModel):
+    line: int
+    code: str
+    detail: str
+
+
+class ItemImportResponse(BaseModel):
+    total_rows: int
+    inserted: int
+    updated: int
+    failed: int
+    errors: list[ItemImportError]
+    errors_truncated: bool = False
+    ignored_columns: list[str] = Field(default_factory=list)
+
+
 class UploadResponse(BaseModel):
     original_path: str
     thumb_path: str
     original_url: str
     thumb_url: str
+    thumb_pending: bool = False
+    size: int | None = None
+    sha256: str | None = None
+
+
+class UploadStatusResponse(BaseModel):
+    status: Literal["pending", "ready", "failed"]
 
 
 class StockInRequest(BaseModel):
@@ -109,6 +159,62 @@ class StockOutRequest(BaseModel):
     notes: str | None = None
 
 
+class StockBatchLine(BaseModel):
+    code: str
+    direction: Literal["in", "out"]
+    quantity: int = Field(gt=0)
+    name: str | None = None
+    notes: str | None = None
+    properties: dict[str, Any] | None = None
+
+
+class StockBatchRequest(BaseModel):
+    table_id: uuid.UUID
+    lines: list[StockBatchLine] = Field(min_length=1, max_length=2000)
+    # False: 任一明细失败则整批回滚；True: 跳过失败明细，其余照常提交
+    allow_partial: bool = False
+
+
+class StockBatchLineError(BaseModel):
+    index: int
+    code: str
+    detail: str
+
+
+class StockBatchResponse(BaseModel):
+    applied: int
+    items: list[ItemRead]
+    errors: list[StockBatchLineError]
+
+
+class StockMovementRead(BaseModel):
+    id: uuid.UUID
+    item_id: uuid.UUID
+    table_id: uuid.UUID
+    code: str
+    delta: int
+    quantity_after: int
+    operator_id: uuid.UUID | None
+    source: str
+    created_at: datetime
+
+    model_config = {"from_attributes": True}
+
+
+class StockMovementPage(BaseModel):
+    movements: list[StockMovementRead]
+    next_cursor: str | None = None
+
+
+class StockTurnoverRow(BaseModel):
+    item_id: uuid.UUID
+    code: str
+    inbound: int
+    outbound: int
+    net: int
+    movements: int
+
+
 class ApiKeyCreateRequest(BaseModel):
     name: str = "默认密钥"
 
@@ -144,3 +250,8 @@ class LogReadResponse(BaseModel):
     created_at: datetime
 
     model_config = {"from_attributes": True}
+
+
+class LogPage(BaseModel):
+    logs: list[LogReadResponse]
+    next_cursor: str | None = None
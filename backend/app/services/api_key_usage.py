@@ -0,0 +1,76 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime
+
+from sqlalchemy import bindparam, update
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models import ApiKey, now_utc
+
+logger = logging.getLogger(__name__)
+
+# api_key_id -> 最近一次使用时间；请求路径只写内存，由后台任务批量落库
+_pending_usage: dict[uuid.UUID, datetime] = {}
+_failed_attempts: dict[uuid.UUID, int] = {}
+MAX_FLUSH_ATTEMPTS = 3
+
+_TOUCH_SQL = (
+    update(ApiKey.__table__)
+    .where(ApiKey.__table__.c.id == bindparam("key_id"))
+    .values(last_used_at=bindparam("used_at"))
+)
+
+
+def touch_api_key(api_key_id: uuid.UUID) -> None:
+    _pending_usage[api_key_id] = now_utc()
+
+
+async def flush_api_key_usage() -> int:
+    if not _pending_usage:
+        return 0
+
+    batch = dict(_pending_usage)
+    _pending_usage.clear()
+    try:
+        async with AsyncSessionLocal() as session:
+            # Core executemany 不校验影响行数：期间被删除的密钥（如随用户级联删除）直接跳过
+            await session.execute(
+                _TOUCH_SQL,
+                [{"key_id": key_id, "used_at": used_at} for key_id, used_at in batch.items()],
+            )
+            await session.commit()
+    except Exception:
+        # 写入失败时放回队列，保留较新的时间戳，下一轮重试；连续失败多次的条目丢弃，避免每轮重复报错
+        for key_id, used_at in batch.items():
+            attempts = _failed_attempts.get(key_id, 0) + 1
+            if attempts >= MAX_FLUSH_ATTEMPTS:
+                _failed_attempts.pop(key_id, None)
+                logger.warning("API Key %s 的使用时间连续 %s 次写入失败，已丢弃", key_id, attempts)
+                continue
+            _failed_attempts[key_id] = attempts
+            current = _pending_usage.get(key_id)
+            if current is None or current < used_at:
+                _pending_usage[key_id] = used_at
+        raise
+    for key_id in batch:
+        _failed_attempts.pop(key_id, None)
+    return len(batch)
+
+
+async def run_api_key_usage_flusher() -> None:
+    interval = max(1, settings.api_key_usage_flush_seconds)
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await flush_api_key_usage()
+            except Exception:
+                logger.exception("API Key 使用时间批量写入失败")
+    except asyncio.CancelledError:
+        try:
+            await flush_api_key_usage()
+        except Exception:
+            logger.exception("API Key 使用时间在停机前写入失败")
+        raise
@@ -0,0 +1,91 @@
+import hashlib
+import uuid
+
+from fastapi import Request, Response, status
+from sqlalchemy import String, event, func, literal_column, select, update
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models import InventoryTable
+
+CHANGE_SEQUENCE = "inventory_change_seq"
+# 本事务内写过物料的表格，提交前统一递增 change_version
+_SESSION_TABLES_KEY = "changed_table_ids"
+
+
+def next_change_version():
+    return func.nextval(literal_column(f"'{CHANGE_SEQUENCE}'"))
+
+
+def bump_table_version(session: AsyncSession, table_id: uuid.UUID) -> None:
+    # 只登记表格，版本号在提交前统一递增：表格行锁只在提交瞬间持有，
+    # 同一表格的并发物料写入不再整段事务互相排队
+    session.info.setdefault(_SESSION_TABLES_KEY, set()).add(table_id)
+
+
+@event.listens_for(Session, "before_commit")
+def _apply_table_versions(session: Session) -> None:
+    table_ids = session.info.pop(_SESSION_TABLES_KEY, None)
+    if not table_ids:
+        return
+    # 显式保留 updated_at，避免每次物料变更都改变表格列表排序；按 id 顺序加锁，多表写入不互相死锁
+    for table_id in sorted(table_ids):
+        session.execute(
+            update(InventoryTable)
+            .where(InventoryTable.id == table_id)
+            .values(change_version=next_change_version(), updated_at=InventoryTable.updated_at)
+            .execution_options(synchronize_session=False)
+        )
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_table_versions(session: Session) -> None:
+    session.info.pop(_SESSION_TABLES_KEY, None)
+
+
+async def read_change_version(session: AsyncSession, table_id: uuid.UUID | None = None) -> str | None:
+    # 必须先读版本再读数据：并发写入时宁可多返回一次 200，也不能把新数据配上旧 ETag
+    if table_id:
+        result = await session.execute(select(InventoryTable.change_version).where(InventoryTable.id == table_id))
+        version = result.scalar_one_or_none()
+        return None if version is None else str(version)
+
+    # 事务提交顺序与取号顺序不一定一致，max(change_version) 会漏掉先取号后提交的写入；
+    # 对全部 (id, change_version) 取摘要，任何一次提交都会改变结果
+    pair = InventoryTable.id.cast(String) + ":" + InventoryTable.change_version.cast(String)
+    digest = func.md5(func.coalesce(func.string_agg(pair, aggregate_order_by(",", InventoryTable.id)), ""))
+    result = await session.execute(select(digest))
+    return result.scalar_one()[:16]
+
+
+def build_etag(request: Request, version: str) -> str:
+    # 同一版本下不同查询参数的结果不同，ETag 里带上路径与参数摘要
+    query = "&".join(sorted(f"{key}={value}" for key, value in request.query_params.multi_items()))
+    digest = hashlib.sha1(f"{request.url.path}?{query}".encode("utf-8")).hexdigest()[:12]
+    return f'W/"{version}-{digest}"'
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = {candidate.strip() for candidate in if_none_match.split(",")}
+    return etag in candidates or "*" in candidates
+
+
+async def current_etag(request: Request, session: AsyncSession, table_id: uuid.UUID | None = None) -> str | None:
+    version = await read_change_version(session, table_id)
+    return build_etag(request, version) if version is not None else None
+
+
+def not_modified_response(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
+def apply_etag(response: Response, etag: str | None) -> None:
+    if not etag:
+        return
+    response.headers["ETag"] = etag
+    # 允许缓存但每次都要带 If-None-Match 回源校验
+    response.headers["Cache-Control"] = "no-cache"
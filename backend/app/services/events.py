@@ -0,0 +1,125 @@
+import asyncio
+import json
+import logging
+import uuid
+from dataclasses import dataclass, field
+from typing import Any
+
+import asyncpg
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import engine
+from app.models import Item
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "inventory_events"
+SUBSCRIBER_QUEUE_SIZE = 500
+RECONNECT_DELAY_SECONDS = 3
+
+# pg_notify 随事务提交才投递，回滚的写入不会产生事件
+_NOTIFY_SQL = text("SELECT pg_notify(:channel, payload) FROM unnest(CAST(:payloads AS TEXT[])) AS payload")
+
+
+def item_event(op: str, item: Item) -> dict[str, Any]:
+    return {
+        "kind": "item",
+        "op": op,
+        "table_id": str(item.table_id),
+        "item_id": str(item.id),
+        "code": item.code,
+        "quantity": item.quantity,
+    }
+
+
+def deleted_item_event(item_id: uuid.UUID, table_id: uuid.UUID, code: str) -> dict[str, Any]:
+    return {"kind": "item", "op": "deleted", "table_id": str(table_id), "item_id": str(item_id), "code": code}
+
+
+def table_event(op: str, table_id: uuid.UUID) -> dict[str, Any]:
+    # 批量写入（导入、删表）只发一条表级事件，客户端收到后整表重新拉取
+    return {"kind": "table", "op": op, "table_id": str(table_id)}
+
+
+async def publish_events(session: AsyncSession, events: list[dict[str, Any]]) -> None:
+    if not events:
+        return
+    payloads = [json.dumps(event, ensure_ascii=False, separators=(",", ":")) for event in events]
+    await session.execute(_NOTIFY_SQL, {"channel": CHANNEL, "payloads": payloads})
+
+
+@dataclass(eq=False)
+class EventSubscriber:
+    table_id: str | None
+    queue: asyncio.Queue = field(default_factory=lambda: asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE))
+
+    def offer(self, event: dict[str, Any]) -> None:
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # 客户端消费不过来时丢弃积压，改发一次 resync 让它整表刷新
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"kind": "resync", "op": "resync"})
+
+
+class EventHub:
+    """把本进程 LISTEN 到的事件分发给已连接的流式客户端。"""
+
+    def __init__(self) -> None:
+        self._subscribers: set[EventSubscriber] = set()
+
+    def subscribe(self, table_id: uuid.UUID | None = None) -> EventSubscriber:
+        subscriber = EventSubscriber(table_id=str(table_id) if table_id else None)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: EventSubscriber) -> None:
+        self._subscribers.discard(subscriber)
+
+    def dispatch(self, event: dict[str, Any]) -> None:
+        table_id = event.get("table_id")
+        for subscriber in list(self._subscribers):
+            if subscriber.table_id and table_id and subscriber.table_id != table_id:
+                continue
+            subscriber.offer(event)
+
+    def handle_notification(self, _connection: Any, _pid: int, _channel: str, payload: str) -> None:
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            logger.warning("忽略无法解析的库存事件: %s", payload[:200])
+            return
+        if isinstance(event, dict):
+            self.dispatch(event)
+
+
+event_hub = EventHub()
+
+
+def _listener_dsn() -> str:
+    return engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+async def run_event_listener() -> None:
+    # 每个 worker 各自 LISTEN 同一频道，写入发生在哪个 worker 都能推送到所有客户端
+    while True:
+        connection = None
+        try:
+            connection = await asyncpg.connect(_listener_dsn())
+            closed = asyncio.Event()
+            connection.add_termination_listener(lambda _connection: closed.set())
+            await connection.add_listener(CHANNEL, event_hub.handle_notification)
+            # 断线期间可能漏掉事件，重连后通知客户端整表刷新
+            event_hub.dispatch({"kind": "resync", "op": "resync"})
+            await closed.wait()
+            logger.warning("库存事件监听连接已断开，准备重连")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("库存事件监听连接失败")
+        finally:
+            if connection is not None and not connection.is_closed():
+                await connection.close()
+        await asyncio.sleep(RECONNECT_DELAY_SECONDS)
@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from collections.abc import Awaitable, Callable
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any
+
+from fastapi import HTTPException, status
+from PIL import Image, UnidentifiedImageError
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+THUMB_SIZE = (300, 300)
+RETRY_AFTER_SECONDS = "3"
+
+_pool: ProcessPoolExecutor | None = None
+_inflight = 0
+_background_tasks: set[asyncio.Task] = set()
+
+
+def _init_worker() -> None:
+    try:
+        from pillow_heif import register_heif_opener
+
+        register_heif_opener()
+    except Exception:
+        # 兼容未安装 heif 扩展的场景，常规格式仍可正常处理
+        pass
+
+
+def _render_thumbnail(source_path: str, thumb_path: str) -> bool:
+    # 在子进程中执行：解码、缩放、编码都不占用事件循环
+    target = Path(thumb_path)
+    # 相同内容的并发上传可能同时生成同一个缩略图，临时文件按进程区分
+    partial = target.with_name(f"{target.name}.{os.getpid()}.part")
+    try:
+        with Image.open(source_path) as img:
+            # JPEG 可直接按缩略图尺寸降采样解码，大图省去大部分解码开销
+            img.draft("RGB", THUMB_SIZE)
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            img.thumbnail(THUMB_SIZE)
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            img.save(partial, format="JPEG", quality=85, optimize=True)
+        # 先写临时文件再改名，缩略图出现在磁盘上即代表已完整生成
+        os.replace(partial, target)
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        partial.unlink(missing_ok=True)
+        return False
+    return True
+
+
+def _render_variant(source_path: str, target_path: str, width: int, image_format: str) -> bool:
+    target = Path(target_path)
+    partial = target.with_name(f"{target.name}.{os.getpid()}.part")
+    try:
+        with Image.open(source_path) as img:
+            img.draft("RGB", (width, width))
+            has_alpha = img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+            target_mode = "RGBA" if has_alpha and image_format != "JPEG" else "RGB"
+            if img.mode != target_mode:
+                img = img.convert(target_mode)
+            # 只缩小不放大：请求尺寸大于原图时仅做格式转换
+            img.thumbnail((width, width))
+            options = {"quality": 80}
+            if image_format == "JPEG":
+                options["optimize"] = True
+            img.save(partial, format=image_format, **options)
+        os.replace(partial, target)
+    except (UnidentifiedImageError, OSError, ValueError, Image.DecompressionBombError):
+        partial.unlink(missing_ok=True)
+        return False
+    return True
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn 避免在已启动事件循环与线程的进程里 fork
+        _pool = ProcessPoolExecutor(
+            max_workers=max(1, settings.image_workers),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+    return _pool
+
+
+def shutdown_image_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _reserve_slot() -> None:
+    global _inflight
+    if _inflight >= max(1, settings.image_queue_limit):
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="图片处理繁忙，请稍后重试",
+            headers={"Retry-After": RETRY_AFTER_SECONDS},
+        )
+    _inflight += 1
+
+
+def _release_slot() -> None:
+    global _inflight
+    _inflight = max(0, _inflight - 1)
+
+
+async def _run_in_pool(func: Callable[..., bool], *args: Any) -> bool:
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_get_pool(), func, *args)
+    except BrokenProcessPool:
+        # 子进程异常退出（如超大图片被 OOM）时重建进程池，本次按处理失败返回
+        logger.exception("图片处理进程池已损坏，正在重建")
+        shutdown_image_pool()
+        return False
+    finally:
+        _release_slot()
+
+
+async def render_thumbnail(source_path: Path, thumb_path: Path) -> bool:
+    _reserve_slot()
+    return await _run_in_pool(_render_thumbnail, str(source_path), str(thumb_path))
+
+
+async def render_variant(source_path: Path, target_path: Path, width: int, image_format: str) -> bool:
+    _reserve_slot()
+    return await _run_in_pool(_render_variant, str(source_path), str(target_path), width, image_format)
+
+
+def schedule_thumbnail(
+    source_path: Path,
+    thumb_path: Path,
+    on_failure: Callable[[], Awaitable[Any]],
+) -> None:
+    # 先占用队列名额，饱和时立即 429，而不是让任务无限堆积
+    _reserve_slot()
+
+    async def _job() -> None:
+        if not await _run_in_pool(_render_thumbnail, str(source_path), str(thumb_path)):
+            # 无法识别的图片由调用方决定如何清理原图，原图消失后状态查询返回 failed
+            try:
+                await on_failure()
+            except Exception:
+                logger.exception("缩略图失败后的清理出错: %s", source_path)
+
+    task = asyncio.create_task(_job())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+def thumbnail_status(source_path: Path, thumb_path: Path) -> str:
+    if thumb_path.exists():
+        return "ready"
+    if not source_path.exists():
+        return "failed"
+    return "pending"
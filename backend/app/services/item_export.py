@@ -0,0 +1,105 @@
+import csv
+import io
+import json
+import uuid
+from collections.abc import AsyncIterator
+from typing import Any
+
+from sqlalchemy import select
+
+from app.core.database import AsyncSessionLocal
+from app.models import InventoryTable, Item
+
+EXPORT_BATCH_SIZE = 1000
+BASE_COLUMNS: list[tuple[str, str]] = [
+    ("code", "编码"),
+    ("name", "名称"),
+    ("quantity", "数量"),
+    ("notes", "备注"),
+    ("image_original", "原图"),
+    ("image_thumb", "缩略图"),
+    ("updated_at", "更新时间"),
+]
+
+
+def schema_field_columns(table: InventoryTable) -> list[tuple[str, str]]:
+    columns: list[tuple[str, str]] = []
+    seen: set[str] = set()
+    for field in (table.schema or {}).get("fields", []):
+        if not isinstance(field, dict):
+            continue
+        key = str(field.get("key") or "").strip()
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        columns.append((key, str(field.get("label") or key)))
+    return columns
+
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+async def stream_table_items(
+    table_id: uuid.UUID,
+    export_format: str,
+    field_columns: list[tuple[str, str]],
+) -> AsyncIterator[bytes]:
+    # 依赖注入的 session 在 StreamingResponse 发送前就会关闭，这里单独开 session；
+    # stream + yield_per 走服务端游标，内存占用只与批大小有关
+    stmt = (
+        select(
+            Item.id,
+            Item.code,
+            Item.name,
+            Item.quantity,
+            Item.notes,
+            Item.image_original,
+            Item.image_thumb,
+            Item.updated_at,
+            Item.properties,
+        )
+        .where(Item.table_id == table_id)
+        .order_by(Item.code)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if export_format == "csv":
+        # BOM 方便 Excel 直接识别 UTF-8 中文表头
+        buffer.write("\ufeff")
+        writer.writerow([label for _, label in BASE_COLUMNS] + [label for _, label in field_columns])
+        yield buffer.getvalue().encode("utf-8")
+
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(stmt)
+        async for rows in result.partitions():
+            buffer.seek(0)
+            buffer.truncate()
+            for row in rows:
+                properties = row.properties or {}
+                if export_format == "csv":
+                    writer.writerow(
+                        [_cell(getattr(row, key)) for key, _ in BASE_COLUMNS]
+                        + [_cell(properties.get(key)) for key, _ in field_columns]
+                    )
+                else:
+                    record = {
+                        "id": str(row.id),
+                        "code": row.code,
+                        "name": row.name,
+                        "quantity": row.quantity,
+                        "notes": row.notes,
+                        "image_original": row.image_original,
+                        "image_thumb": row.image_thumb,
+                        "updated_at": row.updated_at.isoformat(),
+                        "properties": properties,
+                    }
+                    buffer.write(json.dumps(record, ensure_ascii=False))
+                    buffer.write("\n")
+            yield buffer.getvalue().encode("utf-8")
@@ -0,0 +1,85 @@
+import json
+from decimal import Decimal, InvalidOperation
+from typing import Any
+
+from fastapi import HTTPException, status
+from sqlalchemy import ColumnElement, Numeric, case, or_
+
+from app.models import Item
+
+MAX_FILTER_KEYS = 20
+MAX_IN_VALUES = 100
+RANGE_OPS = {"gt", "gte", "lt", "lte"}
+NUMERIC_PATTERN = r"^\s*-?[0-9]+(\.[0-9]+)?\s*$"
+
+
+def _bad_filter(message: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"filters 参数无效：{message}")
+
+
+def _to_decimal(key: str, op: str, value: Any) -> Decimal:
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise _bad_filter(f"{key}.{op} 必须是数字")
+    try:
+        return Decimal(str(value))
+    except InvalidOperation:
+        raise _bad_filter(f"{key}.{op} 必须是数字") from None
+
+
+def _numeric_value(key: str) -> ColumnElement:
+    # 非数字文本返回 NULL，避免 ::numeric 转换报错
+    text_value = Item.properties[key].astext
+    return case((text_value.op("~")(NUMERIC_PATTERN), text_value.cast(Numeric)), else_=None)
+
+
+def parse_property_filters(raw: str) -> list[ColumnElement[bool]]:
+    """解析 filters JSON，例如 {"颜色": "红", "尺码": {"in": ["S", "M"]}, "重量": {"gte": 1, "lt": 5}}。"""
+    try:
+        spec = json.loads(raw)
+    except ValueError:
+        raise _bad_filter("不是合法 JSON") from None
+    if not isinstance(spec, dict):
+        raise _bad_filter("必须是 JSON 对象")
+    if len(spec) > MAX_FILTER_KEYS:
+        raise _bad_filter(f"最多支持 {MAX_FILTER_KEYS} 个属性条件")
+
+    # 所有等值条件合并为一次 properties @> {...}，可走 jsonb_path_ops GIN 索引
+    containment: dict[str, Any] = {}
+    conditions: list[ColumnElement[bool]] = []
+    for key, condition in spec.items():
+        if not isinstance(condition, dict):
+            containment[key] = condition
+            continue
+        if not condition:
+            raise _bad_filter(f"{key} 条件为空")
+
+        for op, value in condition.items():
+            if op == "eq":
+                containment[key] = value
+            elif op == "in":
+                if not isinstance(value, list) or not value:
+                    raise _bad_filter(f"{key}.in 必须是非空数组")
+                if len(value) > MAX_IN_VALUES:
+                    raise _bad_filter(f"{key}.in 最多 {MAX_IN_VALUES} 个值")
+                conditions.append(or_(*[Item.properties.contains({key: option}) for option in value]))
+            elif op == "prefix":
+                if not isinstance(value, str) or not value:
+                    raise _bad_filter(f"{key}.prefix 必须是非空字符串")
+                conditions.append(Item.properties[key].astext.startswith(value, autoescape=True))
+            elif op in RANGE_OPS:
+                bound = _to_decimal(key, op, value)
+                numeric_value = _numeric_value(key)
+                if op == "gt":
+                    conditions.append(numeric_value > bound)
+                elif op == "gte":
+                    conditions.append(numeric_value >= bound)
+                elif op == "lt":
+                    conditions.append(numeric_value < bound)
+                else:
+                    conditions.append(numeric_value <= bound)
+            else:
+                raise _bad_filter(f"不支持的操作符 {op}")
+
+    if containment:
+        conditions.insert(0, Item.properties.contains(containment))
+    return conditions
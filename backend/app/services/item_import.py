@@ -0,0 +1,287 @@
+import asyncio
+import csv
+import io
+import json
+import uuid
+from collections.abc import Iterator
+from itertools import islice
+from typing import Any
+
+from fastapi import HTTPException, UploadFile, status
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import InventoryTable
+
+STAGE_TABLE = "items_import_stage"
+STAGE_COLUMNS = ["line_no", "id", "code", "name", "quantity", "notes", "properties"]
+DEFAULT_IMPORT_NAME = "NUM"
+CSV_PARSE_ERROR = "CSV 解析失败，请确认为 UTF-8 编码的标准 CSV"
+MAX_REPORTED_ERRORS = 1000
+# items.quantity 为 INTEGER，超出范围的行按行报错，不让整个导入失败
+MAX_QUANTITY = 2**31 - 1
+# 解析在线程中进行，每批记录解析完后再 COPY，避免大文件阻塞事件循环
+COPY_BATCH_SIZE = 5000
+BASE_HEADERS = {
+    "code": "code",
+    "编码": "code",
+    "name": "name",
+    "名称": "name",
+    "quantity": "quantity",
+    "数量": "quantity",
+    "notes": "notes",
+    "备注": "notes",
+}
+
+
+class _RowReader:
+    """逐行解析 CSV 为暂存表记录，解析失败的行只记录错误，不中断导入。"""
+
+    def __init__(self, table: InventoryTable, upload: UploadFile) -> None:
+        upload.file.seek(0)
+        self._stream = io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline="")
+        self._reader = csv.reader(self._stream)
+        self.total_rows = 0
+        self.errors: list[dict[str, Any]] = []
+        self.ignored_columns: list[str] = []
+
+        try:
+            header = next(self._reader)
+        except StopIteration:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="CSV 文件为空") from None
+        except (UnicodeDecodeError, csv.Error):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=CSV_PARSE_ERROR) from None
+
+        field_types: dict[str, str] = {}
+        field_by_header: dict[str, str] = {}
+        for field in (table.schema or {}).get("fields", []):
+            if not isinstance(field, dict) or not str(field.get("key") or "").strip():
+                continue
+            key = str(field["key"]).strip()
+            field_types[key] = str(field.get("type") or "text")
+            field_by_header.setdefault(key, key)
+            if field.get("label"):
+                field_by_header.setdefault(str(field["label"]).strip(), key)
+
+        self.base_index: dict[str, int] = {}
+        self.property_index: dict[str, int] = {}
+        for index, raw_name in enumerate(header):
+            name = raw_name.strip()
+            if name in BASE_HEADERS and BASE_HEADERS[name] not in self.base_index:
+                self.base_index[BASE_HEADERS[name]] = index
+            elif name in field_by_header and field_by_header[name] not in self.property_index:
+                self.property_index[field_by_header[name]] = index
+            elif name:
+                self.ignored_columns.append(name)
+        if "code" not in self.base_index:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="CSV 缺少编码列（code / 编码）")
+        self._field_types = field_types
+        self._seen_codes: set[str] = set()
+
+    def _fail(self, line_no: int, code: str, detail: str) -> None:
+        self.errors.append({"line": line_no, "code": code, "detail": detail})
+
+    def _cell(self, row: list[str], index: int | None) -> str:
+        if index is None or index >= len(row):
+            return ""
+        return row[index].strip()
+
+    def _parse_property(self, key: str, value: str) -> Any:
+        if self._field_types.get(key) != "number":
+            return value
+        try:
+            return int(value)
+        except ValueError:
+            number = float(value)
+            if number != number or number in (float("inf"), float("-inf")):
+                raise ValueError(value) from None
+            return number
+
+    def records(self) -> Iterator[tuple]:
+        for row in self._reader:
+            line_no = self._reader.line_num
+            if not any(cell.strip() for cell in row):
+                continue
+            self.total_rows += 1
+
+            code = self._cell(row, self.base_index["code"])
+            if not code:
+                self._fail(line_no, code, "编码不能为空")
+                continue
+            if len(code) > 80:
+                self._fail(line_no, code, "编码长度不能超过 80")
+                continue
+            if code in self._seen_codes:
+                self._fail(line_no, code, "文件内编码重复")
+                continue
+
+            name = None
+            if "name" in self.base_index:
+                name = self._cell(row, self.base_index["name"])
+                if not name:
+                    self._fail(line_no, code, "名称不能为空")
+                    continue
+                if len(name) > 120:
+                    self._fail(line_no, code, "名称长度不能超过 120")
+                    continue
+
+            quantity = None
+            if "quantity" in self.base_index:
+                raw_quantity = self._cell(row, self.base_index["quantity"])
+                try:
+                    quantity = int(raw_quantity)
+                except ValueError:
+                    self._fail(line_no, code, f"数量无效: {raw_quantity}")
+                    continue
+                if quantity < 0:
+                    self._fail(line_no, code, "数量不能为负数")
+                    continue
+                if quantity > MAX_QUANTITY:
+                    self._fail(line_no, code, f"数量不能超过 {MAX_QUANTITY}")
+                    continue
+
+            notes = None
+            if "notes" in self.base_index:
+                notes = self._cell(row, self.base_index["notes"]) or None
+
+            properties: dict[str, Any] = {}
+            invalid_property = None
+            for key, index in self.property_index.items():
+                value = self._cell(row, index)
+                if not value:
+                    continue
+                try:
+                    properties[key] = self._parse_property(key, value)
+                except ValueError:
+                    invalid_property = key
+                    break
+            if invalid_property:
+                self._fail(line_no, code, f"字段 {invalid_property} 需为数字")
+                continue
+
+            self._seen_codes.add(code)
+            yield (line_no, uuid.uuid4(), code, name, quantity, notes, json.dumps(properties, ensure_ascii=False))
+
+
+def _upsert_sql(reader: _RowReader, quantity_mode: str) -> str:
+    # 只覆盖 CSV 中实际出现的列，未出现的列保留库内原值
+    assignments: list[str] = []
+    if "name" in reader.base_index:
+        assignments.append("name = EXCLUDED.name")
+    if "quantity" in reader.base_index:
+        if quantity_mode == "add":
+            assignments.append("quantity = items.quantity + EXCLUDED.quantity")
+        else:
+            assignments.append("quantity = EXCLUDED.quantity")
+    if "notes" in reader.base_index:
+        assignments.append("notes = EXCLUDED.notes")
+    if reader.property_index:
+        assignments.append("properties = items.properties || EXCLUDED.properties")
+    assignments.append("updated_at = EXCLUDED.updated_at")
+
+    # 数量变化按导入前锁定时记下的 old_quantity 计算，写入库存流水
+    return f"""
+        WITH upserted AS (
+          INSERT INTO items (id, table_id, name, code, quantity, notes, properties, updated_at)
+          SELECT s.id, CAST(:table_id AS UUID), COALESCE(s.name, CAST(:default_name AS VARCHAR)),
+                 s.code, COALESCE(s.quantity, 0), s.notes, s.properties, NOW()
+          FROM {STAGE_TABLE} s
+          ORDER BY s.code
+          ON CONFLICT (table_id, code) DO UPDATE SET {", ".join(assignments)}
+          RETURNING items.id, items.table_id, items.code, items.quantity, (xmax = 0) AS inserted
+        ),
+        moved AS (
+          INSERT INTO stock_movements (id, item_id, table_id, code, delta, quantity_after, operator_id, source, created_at)
+          SELECT gen_random_uuid(), u.id, u.table_id, u.code, u.quantity - COALESCE(s.old_quantity, 0), u.quantity,
+                 CAST(:operator_id AS UUID), 'import', NOW()
+          FROM upserted u JOIN {STAGE_TABLE} s ON s.code = u.code
+          WHERE u.quantity <> COALESCE(s.old_quantity, 0)
+        )
+        SELECT
+          COUNT(*) FILTER (WHERE inserted) AS inserted,
+          COUNT(*) FILTER (WHERE NOT inserted) AS updated
+        FROM upserted
+    """
+
+
+async def import_items_csv(
+    session: AsyncSession,
+    table: InventoryTable,
+    upload: UploadFile,
+    quantity_mode: str,
+    operator_id: uuid.UUID | None = None,
+) -> dict[str, Any]:
+    reader = await asyncio.to_thread(_RowReader, table, upload)
+
+    # 通过 asyncpg COPY 写入事务内临时表，再一次性 upsert 到 items
+    connection = await session.connection()
+    raw_connection = await connection.get_raw_connection()
+    driver_connection = raw_connection.driver_connection
+    await session.execute(
+        text(
+            f"""
+            CREATE TEMP TABLE {STAGE_TABLE} (
+              line_no INTEGER NOT NULL,
+              id UUID NOT NULL,
+              code VARCHAR(80) NOT NULL,
+              name VARCHAR(120),
+              quantity INTEGER,
+              notes TEXT,
+              properties JSONB NOT NULL,
+              old_quantity INTEGER
+            ) ON COMMIT DROP
+            """
+        )
+    )
+    records = reader.records()
+    try:
+        while batch := await asyncio.to_thread(lambda: list(islice(records, COPY_BATCH_SIZE))):
+            await driver_connection.copy_records_to_table(STAGE_TABLE, records=batch, columns=STAGE_COLUMNS)
+    except (UnicodeDecodeError, csv.Error):
+        await session.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=CSV_PARSE_ERROR) from None
+
+    # 按编码顺序锁定已存在的物料并记下导入前数量，与 upsert 的加锁顺序一致
+    await session.execute(
+        text(
+            f"""
+            WITH locked AS (
+              SELECT i.code, i.quantity FROM items i
+              WHERE i.table_id = CAST(:table_id AS UUID) AND i.code IN (SELECT code FROM {STAGE_TABLE})
+              ORDER BY i.code
+              FOR UPDATE
+            )
+            UPDATE {STAGE_TABLE} s SET old_quantity = l.quantity FROM locked l WHERE l.code = s.code
+            """
+        ),
+        {"table_id": table.id},
+    )
+    if quantity_mode == "add" and "quantity" in reader.base_index:
+        # 行已锁定，按导入前数量剔除累加后溢出的行并逐行报错，其余行照常导入
+        overflow = await session.execute(
+            text(
+                f"""
+                DELETE FROM {STAGE_TABLE}
+                WHERE CAST(old_quantity AS BIGINT) + quantity > :max_quantity
+                RETURNING line_no, code, old_quantity
+                """
+            ),
+            {"max_quantity": MAX_QUANTITY},
+        )
+        for row in overflow.all():
+            reader._fail(row.line_no, row.code, f"累加后数量超过 {MAX_QUANTITY}（当前 {row.old_quantity}）")
+        reader.errors.sort(key=lambda error: error["line"])
+    result = await session.execute(
+        text(_upsert_sql(reader, quantity_mode)),
+        {"table_id": table.id, "default_name": DEFAULT_IMPORT_NAME, "operator_id": operator_id},
+    )
+    counts = result.one()
+    return {
+        "total_rows": reader.total_rows,
+        "inserted": int(counts.inserted or 0),
+        "updated": int(counts.updated or 0),
+        "failed": len(reader.errors),
+        "errors": reader.errors[:MAX_REPORTED_ERRORS],
+        "errors_truncated": len(reader.errors) > MAX_REPORTED_ERRORS,
+        "ignored_columns": reader.ignored_columns,
+    }
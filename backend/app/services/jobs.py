@@ -0,0 +1,14 @@
+from datetime import timedelta
+from typing import Any
+
+from app.models import now_utc
+
+# 已结束的后台任务保留一段时间供客户端轮询结果，之后从进程内移除
+FINISHED_JOB_TTL_SECONDS = 60 * 60
+
+
+def prune_finished_jobs(jobs: dict[str, Any]) -> None:
+    cutoff = now_utc() - timedelta(seconds=FINISHED_JOB_TTL_SECONDS)
+    expired = [job_id for job_id, job in jobs.items() if job.finished_at and job.finished_at < cutoff]
+    for job_id in expired:
+        del jobs[job_id]
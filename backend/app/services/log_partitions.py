@@ -0,0 +1,252 @@
+import asyncio
+import gzip
+import json
+import logging
+import re
+from datetime import UTC, date, datetime
+from pathlib import Path
+from typing import Any
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.core.config import settings
+from app.core.database import engine
+from app.models import OperationLog, now_utc
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = "operation_logs"
+DEFAULT_PARTITION = f"{PARENT_TABLE}_default"
+PARTITION_PATTERN = re.compile(r"^operation_logs_p(\d{4})(\d{2})$")
+ARCHIVE_DIR = "log_archive"
+EXPORT_CHUNK_SIZE = 2000
+MAINTENANCE_INTERVAL_SECONDS = 6 * 60 * 60
+
+
+def month_start(value: datetime | date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(value: date, months: int) -> date:
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT_TABLE}_p{month.year:04d}{month.month:02d}"
+
+
+async def create_log_partition(conn: AsyncConnection, month: date) -> None:
+    # 分区边界统一按 UTC 月初，与 created_at 的 timestamptz 比较
+    name = partition_name(month)
+    exists = (await conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name})).scalar_one()
+    if exists:
+        return
+
+    lower = f"{month.isoformat()} 00:00:00+00"
+    upper = f"{add_months(month, 1).isoformat()} 00:00:00+00"
+    bounds = f"FOR VALUES FROM ('{lower}') TO ('{upper}')"
+    in_range = f"created_at >= '{lower}' AND created_at < '{upper}'"
+    stranded = (
+        await conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE {in_range})"))
+    ).scalar_one()
+    if not stranded:
+        await conn.execute(text(f"CREATE TABLE {name} PARTITION OF {PARENT_TABLE} {bounds}"))
+        return
+
+    # 维护任务停摆期间落入默认分区的日志：先建独立表并搬入，再挂载为分区
+    await conn.execute(text(f"CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    await conn.execute(
+        text(
+            f"""
+            WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE {in_range} RETURNING *)
+            INSERT INTO {name} SELECT * FROM moved
+            """
+        )
+    )
+    await conn.execute(text(f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} {bounds}"))
+
+
+async def ensure_log_partitions(conn: AsyncConnection, since: date | None = None) -> None:
+    # 默认分区兜底：分区维护任务没跑到（停摆、时钟偏差）时日志仍能写入，不会连带业务写入失败
+    await conn.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT_TABLE} DEFAULT"))
+    # 从 since（默认当月）起建到 N 个月之后，写入永远落在已存在的分区里
+    current = month_start(now_utc())
+    month = month_start(since) if since else current
+    last = add_months(current, max(1, settings.operation_log_partition_months_ahead))
+    while month <= last:
+        await create_log_partition(conn, month)
+        month = add_months(month, 1)
+
+
+async def convert_operation_logs(conn: AsyncConnection) -> None:
+    # 旧版本的普通表一次性改造为分区表：改名 -> 按模型建分区表 -> 回填 -> 删除旧表
+    relkind = (
+        await conn.execute(text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)"), {"name": PARENT_TABLE})
+    ).scalar_one_or_none()
+    if relkind != "r":
+        return
+
+    await conn.execute(text(f"ALTER TABLE {PARENT_TABLE} RENAME TO {PARENT_TABLE}_legacy"))
+    # 旧表的约束与索引名会和新表冲突，回填只需要数据，直接删掉
+    await conn.execute(
+        text(
+            f"""
+            DO $$
+            DECLARE r RECORD;
+            BEGIN
+              FOR r IN SELECT conname FROM pg_constraint WHERE conrelid = '{PARENT_TABLE}_legacy'::regclass LOOP
+                EXECUTE format('ALTER TABLE {PARENT_TABLE}_legacy DROP CONSTRAINT %I', r.conname);
+              END LOOP;
+              FOR r IN SELECT indexname FROM pg_indexes WHERE tablename = '{PARENT_TABLE}_legacy' LOOP
+                EXECUTE format('DROP INDEX %I', r.indexname);
+              END LOOP;
+            END
+            $$;
+            """
+        )
+    )
+    await conn.run_sync(lambda sync_conn: OperationLog.__table__.create(sync_conn))
+
+    oldest = (
+        await conn.execute(text(f"SELECT MIN(created_at) FROM {PARENT_TABLE}_legacy WHERE created_at IS NOT NULL"))
+    ).scalar_one_or_none()
+    await ensure_log_partitions(conn, since=oldest.astimezone(UTC) if oldest else None)
+    await conn.execute(
+        text(
+            f"""
+            INSERT INTO {PARENT_TABLE} (id, operator_id, action, target, summary, detail, created_at)
+            SELECT id, operator_id, action, COALESCE(target, ''), COALESCE(summary, ''),
+                   COALESCE(detail, '{{}}'::jsonb), COALESCE(created_at, NOW())
+            FROM {PARENT_TABLE}_legacy
+            """
+        )
+    )
+    await conn.execute(text(f"DROP TABLE {PARENT_TABLE}_legacy"))
+
+
+def _archive_row(row: Any) -> str:
+    return json.dumps(
+        {
+            "id": str(row.id),
+            "operator_id": str(row.operator_id) if row.operator_id else None,
+            "action": row.action,
+            "target": row.target,
+            "summary": row.summary,
+            "detail": row.detail or {},
+            "created_at": row.created_at.isoformat(),
+        },
+        ensure_ascii=False,
+    )
+
+
+async def _export_partition(name: str, archive_path: Path) -> int:
+    # 流式读取写入 .part，完整写完再改名，归档文件存在即代表内容完整
+    archive_path.parent.mkdir(parents=True, exist_ok=True)
+    partial = archive_path.with_name(f"{archive_path.name}.part")
+    exported = 0
+    handle = await asyncio.to_thread(gzip.open, partial, "wt", encoding="utf-8")
+    try:
+        async with engine.connect() as conn:
+            result = await conn.stream(
+                text(
+                    f"SELECT id, operator_id, action, target, summary, detail, created_at "
+                    f"FROM {name} ORDER BY created_at, id"
+                )
+            )
+            async for rows in result.partitions(EXPORT_CHUNK_SIZE):
+                lines = "".join(f"{_archive_row(row)}\n" for row in rows)
+                await asyncio.to_thread(handle.write, lines)
+                exported += len(rows)
+        await asyncio.to_thread(handle.close)
+        partial.replace(archive_path)
+    except BaseException:
+        handle.close()
+        partial.unlink(missing_ok=True)
+        raise
+    return exported
+
+
+async def _drain_default_partition() -> None:
+    # 默认分区里已过去月份的日志按月搬进独立分区，过期后与普通分区一样归档、删除
+    current_bound = f"{month_start(now_utc()).isoformat()} 00:00:00+00"
+    async with engine.begin() as conn:
+        result = await conn.execute(
+            text(
+                f"""
+                SELECT DISTINCT date_trunc('month', created_at AT TIME ZONE 'UTC')::date AS month
+                FROM {DEFAULT_PARTITION}
+                WHERE created_at < '{current_bound}'
+                ORDER BY month
+                """
+            )
+        )
+        for month in result.scalars().all():
+            await create_log_partition(conn, month)
+
+    async with engine.connect() as conn:
+        remaining = (await conn.execute(text(f"SELECT COUNT(*) FROM {DEFAULT_PARTITION}"))).scalar_one()
+    if remaining:
+        # 通常是时钟偏差写入的远期日志，或同名分区仍未归档完，需要人工确认
+        logger.warning("操作日志默认分区 %s 仍有 %s 条日志未归入月分区", DEFAULT_PARTITION, remaining)
+
+
+async def archive_expired_log_partitions() -> list[str]:
+    retention = settings.operation_log_retention_months
+    if retention <= 0:
+        return []
+    cutoff = add_months(month_start(now_utc()), -retention)
+    await _drain_default_partition()
+
+    async with engine.connect() as conn:
+        result = await conn.execute(
+            text(
+                """
+                SELECT c.relname, i.inhparent IS NOT NULL AS attached
+                FROM pg_class c
+                LEFT JOIN pg_inherits i ON i.inhrelid = c.oid
+                WHERE c.relkind = 'r' AND c.relname LIKE 'operation_logs_p%'
+                ORDER BY c.relname
+                """
+            )
+        )
+        partitions = result.all()
+
+    archived: list[str] = []
+    archive_root = Path(settings.ops_dir) / ARCHIVE_DIR
+    for name, attached in partitions:
+        matched = PARTITION_PATTERN.match(name)
+        if not matched:
+            continue
+        month = date(int(matched.group(1)), int(matched.group(2)), 1)
+        if add_months(month, 1) > cutoff:
+            continue
+
+        if attached:
+            # 先分离再导出：分离后不会再有写入，导出失败时下一轮按已分离的表继续处理
+            async with engine.begin() as conn:
+                await conn.execute(text("SET LOCAL lock_timeout = '5s'"))
+                await conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+
+        exported = await _export_partition(name, archive_root / f"{name}.jsonl.gz")
+        async with engine.begin() as conn:
+            await conn.execute(text(f"DROP TABLE {name}"))
+        logger.info("操作日志分区 %s 已归档（%s 条）", name, exported)
+        archived.append(name)
+    return archived
+
+
+async def maintain_log_partitions() -> list[str]:
+    async with engine.begin() as conn:
+        await ensure_log_partitions(conn)
+    return await archive_expired_log_partitions()
+
+
+async def run_log_partition_maintenance() -> None:
+    while True:
+        try:
+            await maintain_log_partitions()
+        except Exception:
+            logger.exception("操作日志分区维护失败")
+        await asyncio.sleep(MAINTENANCE_INTERVAL_SECONDS)
@@ -1,10 +1,37 @@
+import asyncio
+import logging
 import uuid
 from typing import Any
 
+from sqlalchemy import event, insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
 
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
 from app.core.request_context import get_auth_context
-from app.models import OperationLog
+from app.models import OperationLog, now_utc
+
+logger = logging.getLogger(__name__)
+
+# 会话内暂存的日志行：提交前（transactional）或提交后（buffered）统一处理，不再逐条 flush
+_SESSION_DURABLE_KEY = "operation_logs_durable"
+_SESSION_BUFFERED_KEY = "operation_logs_buffered"
+
+# buffered 模式下已提交业务、等待批量写入的日志；进程崩溃最多丢失一个刷新周期内的条目
+_pending_logs: list[dict[str, Any]] = []
+_flush_requested = asyncio.Event()
+
+
+def build_log_detail(detail: dict[str, Any] | None = None) -> dict[str, Any]:
+    merged_detail = dict(detail or {})
+    auth_context = get_auth_context() or {}
+    if auth_context:
+        merged_detail.setdefault("operator_id", auth_context.get("operator_id"))
+        merged_detail.setdefault("operator_username", auth_context.get("operator_username"))
+        merged_detail.setdefault("auth_source", auth_context.get("auth_source"))
+        merged_detail.setdefault("auth_label", auth_context.get("auth_label"))
+    return merged_detail
 
 
 async def log_operation(
@@ -14,21 +41,94 @@ async def log_operation(
     summary: str,
     detail: dict[str, Any] | None = None,
     operator_id: uuid.UUID | None = None,
+    durable: bool = False,
 ) -> None:
-    merged_detail = dict(detail or {})
-    auth_context = get_auth_context() or {}
-    if auth_context:
-        merged_detail.setdefault("operator_id", auth_context.get("operator_id"))
-        merged_detail.setdefault("operator_username", auth_context.get("operator_username"))
-        merged_detail.setdefault("auth_source", auth_context.get("auth_source"))
-        merged_detail.setdefault("auth_label", auth_context.get("auth_label"))
+    # durable=True 的日志始终与业务变更同事务提交（账号、密钥、系统运维等审计敏感操作）
+    row = {
+        "id": uuid.uuid4(),
+        "operator_id": operator_id,
+        "action": action,
+        "target": target,
+        "summary": summary,
+        "detail": build_log_detail(detail),
+        "created_at": now_utc(),
+    }
+    buffered = settings.operation_log_mode == "buffered" and not durable
+    key = _SESSION_BUFFERED_KEY if buffered else _SESSION_DURABLE_KEY
+    session.info.setdefault(key, []).append(row)
+
+
+@event.listens_for(Session, "before_commit")
+def _write_durable_logs(session: Session) -> None:
+    # 同一事务内的多条日志合并为一条多行 INSERT，随提交一起写入
+    rows = session.info.pop(_SESSION_DURABLE_KEY, None)
+    if rows:
+        session.execute(insert(OperationLog), rows)
+
+
+@event.listens_for(Session, "after_commit")
+def _enqueue_buffered_logs(session: Session) -> None:
+    rows = session.info.pop(_SESSION_BUFFERED_KEY, None)
+    if rows:
+        _enqueue(rows)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_session_logs(session: Session) -> None:
+    # 业务回滚时对应日志一并丢弃
+    session.info.pop(_SESSION_DURABLE_KEY, None)
+    session.info.pop(_SESSION_BUFFERED_KEY, None)
+
+
+def _trim_pending_logs() -> None:
+    overflow = len(_pending_logs) - max(1, settings.operation_log_max_buffer)
+    if overflow > 0:
+        # 数据库长时间不可用时限制内存占用，丢弃最早的条目
+        del _pending_logs[:overflow]
+        logger.warning("操作日志缓冲区已满，丢弃 %s 条最早的日志", overflow)
+
+
+def _enqueue(rows: list[dict[str, Any]]) -> None:
+    _pending_logs.extend(rows)
+    _trim_pending_logs()
+    if len(_pending_logs) >= max(1, settings.operation_log_batch_size):
+        _flush_requested.set()
+
+
+async def flush_operation_logs() -> int:
+    if not _pending_logs:
+        return 0
+
+    batch = list(_pending_logs)
+    _pending_logs.clear()
+    try:
+        async with AsyncSessionLocal() as session:
+            await session.execute(insert(OperationLog), batch)
+            await session.commit()
+    except Exception:
+        # 写入失败时放回队列头部，下一轮重试
+        _pending_logs[:0] = batch
+        _trim_pending_logs()
+        raise
+    return len(batch)
+
 
-    log_row = OperationLog(
-        operator_id=operator_id,
-        action=action,
-        target=target,
-        summary=summary,
-        detail=merged_detail,
-    )
-    session.add(log_row)
-    await session.flush()
+async def run_operation_log_flusher() -> None:
+    interval = max(0.1, settings.operation_log_flush_seconds)
+    try:
+        while True:
+            try:
+                await asyncio.wait_for(_flush_requested.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            _flush_requested.clear()
+            try:
+                await flush_operation_logs()
+            except Exception:
+                logger.exception("操作日志批量写入失败")
+    except asyncio.CancelledError:
+        try:
+            await flush_operation_logs()
+        except Exception:
+            logger.exception("操作日志在停机前写入失败")
+        raise
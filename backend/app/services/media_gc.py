@@ -0,0 +1,265 @@
+import asyncio
+import logging
+import os
+import uuid
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from datetime import UTC, datetime, timedelta
+from itertools import islice
+from pathlib import Path
+from typing import Any
+
+from sqlalchemy import delete, or_, select, union
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models import Item, MediaFile, now_utc
+from app.services.jobs import prune_finished_jobs
+from app.services.logs import log_operation
+from app.services.media_store import STAGING_DIR
+
+logger = logging.getLogger(__name__)
+
+# 只扫描持久化的原图与缩略图；tmp 下是上传中途失败遗留的临时文件，超过宽限期一律视为孤立
+GC_DIRS = ("originals", "thumbs", STAGING_DIR)
+REPORT_SAMPLE_LIMIT = 100
+
+_gc_lock = asyncio.Lock()
+# 手动触发的清理在后台执行，进度保存在进程内；后端按单进程部署，查询与执行落在同一进程
+_jobs: dict[str, "MediaGcReport"] = {}
+_tasks: set[asyncio.Task] = set()
+
+
+@dataclass(eq=False)
+class MediaGcReport:
+    dry_run: bool
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = "running"
+    error: str | None = None
+    scanned: int = 0
+    skipped_recent: int = 0
+    orphans: int = 0
+    orphan_bytes: int = 0
+    deleted: int = 0
+    samples: list[str] = field(default_factory=list)
+    started_at: datetime = field(default_factory=now_utc)
+    finished_at: datetime | None = None
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "error": self.error,
+            "dry_run": self.dry_run,
+            "scanned": self.scanned,
+            "skipped_recent": self.skipped_recent,
+            "orphans": self.orphans,
+            "orphan_bytes": self.orphan_bytes,
+            "deleted": self.deleted,
+            "samples": self.samples,
+            "started_at": self.started_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+def media_gc_running() -> bool:
+    return _gc_lock.locked()
+
+
+def _iter_media_files(images_root: Path) -> Iterator[tuple[str, float, int]]:
+    for directory in GC_DIRS:
+        root = images_root / directory
+        if not root.is_dir():
+            continue
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = Path(dirpath) / filename
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                yield path.relative_to(images_root).as_posix(), stat.st_mtime, stat.st_size
+
+
+async def _referenced_paths(session: AsyncSession, paths: list[str], cutoff: datetime) -> set[str]:
+    # 三路都按 path 走索引：物料引用、仍被计数引用或仍在宽限期内的媒体登记
+    stmt = union(
+        select(Item.image_original.label("path")).where(Item.image_original.in_(paths)),
+        select(Item.image_thumb.label("path")).where(Item.image_thumb.in_(paths)),
+        select(MediaFile.path.label("path")).where(
+            MediaFile.path.in_(paths),
+            or_(MediaFile.ref_count > 0, MediaFile.last_uploaded_at >= cutoff),
+        ),
+    )
+    result = await session.execute(stmt)
+    return set(result.scalars().all())
+
+
+def _unlink_files(images_root: Path, paths: list[str]) -> int:
+    removed = 0
+    for relative_path in paths:
+        try:
+            (images_root / relative_path).unlink(missing_ok=True)
+        except OSError:
+            continue
+        removed += 1
+    return removed
+
+
+async def _collect(report: MediaGcReport) -> MediaGcReport:
+    dry_run = report.dry_run
+    images_root = Path(settings.images_dir)
+    grace = timedelta(seconds=max(0, settings.media_orphan_grace_seconds))
+    cutoff = now_utc() - grace
+    cutoff_ts = cutoff.timestamp()
+    batch_size = max(1, settings.media_gc_batch_size)
+    max_rate = max(1, settings.media_gc_max_deletes_per_second)
+
+    files = _iter_media_files(images_root)
+    while True:
+        # 目录遍历在线程中分批推进，单批内存与数据库 IN 列表都受 batch_size 约束
+        batch = await asyncio.to_thread(lambda: list(islice(files, batch_size)))
+        if not batch:
+            break
+        report.scanned += len(batch)
+
+        # 文件 mtime 也要早于宽限期：刚改名落盘、尚未登记的上传不会被误删
+        sizes: dict[str, int] = {}
+        mtimes: dict[str, float] = {}
+        for relative_path, mtime, size in batch:
+            if mtime >= cutoff_ts:
+                report.skipped_recent += 1
+            else:
+                sizes[relative_path] = size
+                mtimes[relative_path] = mtime
+        if not sizes:
+            continue
+
+        candidates = sorted(sizes)
+        stored = [path for path in candidates if not path.startswith(f"{STAGING_DIR}/")]
+        async with AsyncSessionLocal() as session:
+            referenced = await _referenced_paths(session, stored, cutoff) if stored else set()
+            orphans = [path for path in candidates if path not in referenced]
+            if not orphans:
+                continue
+
+            report.orphans += len(orphans)
+            report.orphan_bytes += sum(sizes[path] for path in orphans)
+            room = REPORT_SAMPLE_LIMIT - len(report.samples)
+            if room > 0:
+                report.samples.extend(orphans[:room])
+            if dry_run:
+                continue
+
+            removable = [path for path in orphans if path.startswith(f"{STAGING_DIR}/")]
+            stored_orphans = [path for path in orphans if not path.startswith(f"{STAGING_DIR}/")]
+            if stored_orphans:
+                # 未登记的孤立文件先按文件 mtime 补登记，已有登记行（含并发上传刚写入的）保持不变
+                await session.execute(
+                    pg_insert(MediaFile)
+                    .values(
+                        [
+                            {"path": path, "ref_count": 0, "last_uploaded_at": datetime.fromtimestamp(mtimes[path], UTC)}
+                            for path in stored_orphans
+                        ]
+                    )
+                    .on_conflict_do_nothing(index_elements=[MediaFile.path])
+                )
+                # 条件与 cleanup_unreferenced_media 一致；查询之后才到达的去重上传或新引用会让条件不成立，
+                # 只删除确实删掉登记行的文件
+                result = await session.execute(
+                    delete(MediaFile)
+                    .where(
+                        MediaFile.path.in_(stored_orphans),
+                        MediaFile.ref_count <= 0,
+                        MediaFile.last_uploaded_at < cutoff,
+                    )
+                    .returning(MediaFile.path)
+                )
+                removable.extend(result.scalars().all())
+                await session.commit()
+
+        report.deleted += await asyncio.to_thread(_unlink_files, images_root, removable)
+        # 限速：按本批删除数量让出时间，避免 NAS 上的突发 IO
+        await asyncio.sleep(len(removable) / max_rate)
+
+    report.status = "completed"
+    report.finished_at = now_utc()
+    return report
+
+
+async def collect_orphan_media(dry_run: bool = True) -> MediaGcReport:
+    report = MediaGcReport(dry_run=dry_run)
+    if dry_run:
+        return await _collect(report)
+    async with _gc_lock:
+        return await _collect(report)
+
+
+def get_media_gc_job(job_id: str) -> MediaGcReport | None:
+    prune_finished_jobs(_jobs)
+    return _jobs.get(job_id)
+
+
+def running_media_gc_job() -> MediaGcReport | None:
+    for job in _jobs.values():
+        if job.status == "running":
+            return job
+    return None
+
+
+async def _run_job(report: MediaGcReport, operator_id: uuid.UUID | None) -> None:
+    try:
+        async with _gc_lock:
+            await _collect(report)
+        async with AsyncSessionLocal() as session:
+            await log_operation(
+                session=session,
+                action="media_gc",
+                target="system",
+                summary=f"Remove {report.deleted} orphan media files",
+                detail={
+                    "job_id": report.id,
+                    "scanned": report.scanned,
+                    "orphans": report.orphans,
+                    "deleted": report.deleted,
+                },
+                operator_id=operator_id,
+                durable=True,
+            )
+            await session.commit()
+        report.status = "completed"
+    except Exception as exc:
+        logger.exception("孤立图片清理任务 %s 失败", report.id)
+        report.status = "failed"
+        report.error = str(exc) or exc.__class__.__name__
+    finally:
+        report.finished_at = now_utc()
+
+
+def start_media_gc_job(operator_id: uuid.UUID | None) -> MediaGcReport:
+    prune_finished_jobs(_jobs)
+    report = MediaGcReport(dry_run=False)
+    _jobs[report.id] = report
+    task = asyncio.create_task(_run_job(report, operator_id))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return report
+
+
+async def run_media_gc_loop() -> None:
+    interval = settings.media_gc_interval_seconds
+    if interval <= 0:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        if media_gc_running():
+            continue
+        try:
+            report = await collect_orphan_media(dry_run=False)
+            if report.deleted:
+                logger.info("孤立图片清理完成：扫描 %s 个文件，删除 %s 个", report.scanned, report.deleted)
+        except Exception:
+            logger.exception("孤立图片清理失败")
@@ -0,0 +1,153 @@
+import hashlib
+import uuid
+from collections.abc import Iterable
+from dataclasses import dataclass
+from datetime import timedelta
+from pathlib import Path
+
+from fastapi import HTTPException, UploadFile, status
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models import MediaFile, now_utc
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+STAGING_DIR = "tmp"
+
+
+@dataclass(frozen=True)
+class StagedUpload:
+    path: Path
+    size: int
+    sha256: str
+
+
+async def stage_upload(upload: UploadFile, max_size: int, too_large_detail: str) -> StagedUpload:
+    # 分块写入 images_dir 下的临时文件，边写边累计大小和 sha256，
+    # 单次上传的内存占用只与块大小有关
+    staging_dir = Path(settings.images_dir) / STAGING_DIR
+    staging_dir.mkdir(parents=True, exist_ok=True)
+    staged_path = staging_dir / f"{uuid.uuid4().hex}.part"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with staged_path.open("wb") as handle:
+            while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_size:
+                    raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=too_large_detail)
+                digest.update(chunk)
+                handle.write(chunk)
+    except BaseException:
+        staged_path.unlink(missing_ok=True)
+        raise
+
+    if size == 0:
+        staged_path.unlink(missing_ok=True)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="上传文件为空")
+    return StagedUpload(path=staged_path, size=size, sha256=digest.hexdigest())
+
+
+def resolve_media_path(relative_path: str | None) -> Path | None:
+    normalized = str(relative_path or "").strip().replace("\\", "/").lstrip("/")
+    if not normalized:
+        return None
+
+    images_root = Path(settings.images_dir).resolve()
+    candidate = (images_root / normalized).resolve()
+    try:
+        candidate.relative_to(images_root)
+    except ValueError:
+        return None
+    return candidate
+
+
+def content_paths(sha256: str, suffix: str) -> tuple[str, str]:
+    # 同一内容只存一份：文件名即内容哈希
+    return f"originals/{sha256}{suffix}", f"thumbs/{sha256}.jpg"
+
+
+async def find_original_by_hash(session: AsyncSession, sha256: str) -> str | None:
+    result = await session.execute(
+        select(MediaFile.path)
+        .where(MediaFile.sha256 == sha256, MediaFile.path.startswith("originals/"))
+        .order_by(MediaFile.path)
+        .limit(1)
+    )
+    return result.scalar_one_or_none()
+
+
+async def register_upload(
+    session: AsyncSession,
+    original_path: str,
+    thumb_path: str,
+    sha256: str,
+    size: int,
+) -> None:
+    # 只登记文件与最近上传时间；引用数由 items 触发器维护
+    now = now_utc()
+    stmt = pg_insert(MediaFile).values(
+        [
+            {"path": original_path, "sha256": sha256, "size": size, "ref_count": 0, "last_uploaded_at": now},
+            {"path": thumb_path, "sha256": sha256, "size": None, "ref_count": 0, "last_uploaded_at": now},
+        ]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[MediaFile.path],
+        set_={"sha256": stmt.excluded.sha256, "last_uploaded_at": stmt.excluded.last_uploaded_at},
+    )
+    await session.execute(stmt)
+
+
+async def cleanup_unreferenced_media(session: AsyncSession, paths: Iterable[str | None]) -> int:
+    # 引用数归零且超过宽限期的文件才删除；一条语句完成判断并删除登记行
+    candidates = sorted({str(path).strip() for path in paths if path and str(path).strip()})
+    if not candidates:
+        return 0
+
+    cutoff = now_utc() - timedelta(seconds=max(0, settings.media_orphan_grace_seconds))
+    result = await session.execute(
+        delete(MediaFile)
+        .where(
+            MediaFile.path.in_(candidates),
+            MediaFile.ref_count <= 0,
+            MediaFile.last_uploaded_at < cutoff,
+        )
+        .returning(MediaFile.path)
+    )
+    removed = list(result.scalars().all())
+    await session.commit()
+
+    for relative_path in removed:
+        absolute_path = resolve_media_path(relative_path)
+        if not absolute_path:
+            continue
+        try:
+            absolute_path.unlink(missing_ok=True)
+        except OSError:
+            # Keep request successful even if stale file cleanup fails.
+            continue
+    return len(removed)
+
+
+async def discard_failed_original(relative_path: str) -> bool:
+    # 缩略图生成失败时清理原图；按内容去重后同一原图可能已被其它物料引用，只有引用数为 0 时才删除
+    absolute_path = resolve_media_path(relative_path)
+    if not absolute_path:
+        return False
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(MediaFile.ref_count).where(MediaFile.path == relative_path).with_for_update()
+        )
+        ref_count = result.scalar_one_or_none()
+        if ref_count is not None and ref_count > 0:
+            return False
+        if ref_count is not None:
+            await session.execute(delete(MediaFile).where(MediaFile.path == relative_path))
+        # 持有行锁时删除文件：并发上传同一内容的登记会等到这里提交，不会登记到已删除的文件
+        absolute_path.unlink(missing_ok=True)
+        await session.commit()
+    return True
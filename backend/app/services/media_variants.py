@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import os
+from pathlib import Path
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = "variants"
+VARIANT_WIDTHS = (64, 150, 300, 600, 1200)
+# format 参数 -> (Pillow 格式, Content-Type, 扩展名)
+VARIANT_FORMATS: dict[str, tuple[str, str, str]] = {
+    "jpeg": ("JPEG", "image/jpeg", ".jpg"),
+    "webp": ("WEBP", "image/webp", ".webp"),
+    "avif": ("AVIF", "image/avif", ".avif"),
+}
+# 淘汰时清理到预算的 90%，避免每生成一个变体就触发一次扫描
+EVICT_TARGET_RATIO = 0.9
+
+
+def variant_path(relative_path: str, width: int, variant_format: str) -> Path:
+    extension = VARIANT_FORMATS[variant_format][2]
+    return Path(settings.images_dir) / VARIANTS_DIR / str(width) / f"{relative_path}{extension}"
+
+
+class VariantCache:
+    """变体文件的磁盘 LRU：命中时刷新 mtime，超出预算后按 mtime 从旧到新删除。"""
+
+    def __init__(self) -> None:
+        self._total_bytes: int | None = None
+        self._evicting = False
+
+    @property
+    def root(self) -> Path:
+        return Path(settings.images_dir) / VARIANTS_DIR
+
+    @property
+    def max_bytes(self) -> int:
+        return max(0, settings.variant_cache_max_mb) * 1024 * 1024
+
+    def touch(self, path: Path) -> None:
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _scan(self) -> list[tuple[float, int, Path]]:
+        entries: list[tuple[float, int, Path]] = []
+        if not self.root.exists():
+            return entries
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith(".part"):
+                    continue
+                path = Path(dirpath) / filename
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict(self, keep: Path) -> int:
+        entries = self._scan()
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * EVICT_TARGET_RATIO)
+        if total <= self.max_bytes:
+            return total
+        for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+            if total <= target:
+                break
+            if path == keep:
+                # 刚生成、马上要返回给客户端的文件不参与淘汰
+                continue
+            try:
+                path.unlink(missing_ok=True)
+            except OSError:
+                continue
+            total -= size
+        return total
+
+    async def record(self, path: Path) -> None:
+        try:
+            size = path.stat().st_size
+        except OSError:
+            return
+        if self._total_bytes is None:
+            self._total_bytes = sum(entry[1] for entry in await asyncio.to_thread(self._scan))
+        else:
+            self._total_bytes += size
+        if self._total_bytes <= self.max_bytes or self._evicting:
+            return
+
+        self._evicting = True
+        try:
+            # 目录扫描与删除放到线程里，不阻塞事件循环
+            self._total_bytes = await asyncio.to_thread(self._evict, path)
+        except Exception:
+            logger.exception("图片变体缓存淘汰失败")
+        finally:
+            self._evicting = False
+
+
+variant_cache = VariantCache()
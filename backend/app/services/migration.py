@@ -4,18 +4,31 @@ from sqlalchemy import select, text
 from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
 
 from app.models import InventoryTable
+from app.services.events import CHANNEL
+from app.services.log_partitions import convert_operation_logs, ensure_log_partitions
 
 
 async def _run_ddl(conn: AsyncConnection, sql: str) -> None:
     await conn.execute(text(sql))
 
 
+async def _trigger_exists(conn: AsyncConnection, name: str) -> bool:
+    # 回填类操作只在触发器首次安装时执行一次，之后的数据由触发器增量维护
+    result = await conn.execute(text("SELECT 1 FROM pg_trigger WHERE tgname = :name"), {"name": name})
+    return result.scalar_one_or_none() is not None
+
+
 async def migrate_schema(conn: AsyncConnection) -> None:
     await _run_ddl(conn, "ALTER TABLE users ADD COLUMN IF NOT EXISTS role VARCHAR(20) DEFAULT 'operator'")
     await _run_ddl(conn, "ALTER TABLE users ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ DEFAULT NOW()")
     await _run_ddl(conn, "UPDATE users SET role = 'operator' WHERE role IS NULL OR role = ''")
 
     await _run_ddl(conn, "ALTER TABLE items ADD COLUMN IF NOT EXISTS table_id UUID")
+    await _run_ddl(
+        conn,
+        "ALTER TABLE inventory_tables ADD COLUMN IF NOT EXISTS change_version BIGINT NOT NULL DEFAULT 0",
+    )
+    await _run_ddl(conn, "CREATE SEQUENCE IF NOT EXISTS inventory_change_seq")
     await _run_ddl(conn, "ALTER TABLE api_keys ADD COLUMN IF NOT EXISTS api_key VARCHAR(255)")
     await _run_ddl(conn, "ALTER TABLE operation_logs ADD COLUMN IF NOT EXISTS detail JSONB DEFAULT '{}'::jsonb")
 
@@ -32,6 +45,28 @@ async def migrate_schema(conn: AsyncConnection) -> None:
         """,
     )
     await _run_ddl(conn, "CREATE UNIQUE INDEX IF NOT EXISTS uq_items_table_code ON items (table_id, code)")
+    await _run_ddl(conn, "CREATE INDEX IF NOT EXISTS ix_items_updated_id ON items (updated_at, id)")
+    await _run_ddl(conn, "CREATE INDEX IF NOT EXISTS ix_items_table_updated_id ON items (table_id, updated_at, id)")
+    # 图片引用反查（孤立文件判断、引用数重算）走索引，不再整表扫描
+    await _run_ddl(conn, "CREATE INDEX IF NOT EXISTS ix_items_image_original ON items (image_original)")
+    await _run_ddl(conn, "CREATE INDEX IF NOT EXISTS ix_items_image_thumb ON items (image_thumb)")
+    await _run_ddl(conn, "ALTER TABLE items ADD COLUMN IF NOT EXISTS reorder_level INTEGER")
+    await _run_ddl(conn, "ALTER TABLE items ADD COLUMN IF NOT EXISTS is_low_stock BOOLEAN NOT NULL DEFAULT FALSE")
+    # 低库存列表只扫描部分索引，规模与低库存物料数相关，与物料总数无关
+    await _run_ddl(
+        conn,
+        "CREATE INDEX IF NOT EXISTS ix_items_low_stock ON items (table_id, quantity, id) WHERE is_low_stock",
+    )
+
+    # 模糊搜索：pg_trgm GIN 索引同时服务 ILIKE '%q%' 与 similarity / <% 排序检索
+    await _run_ddl(conn, "CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    await _run_ddl(conn, "CREATE INDEX IF NOT EXISTS ix_items_name_trgm ON items USING gin (name gin_trgm_ops)")
+    await _run_ddl(conn, "CREATE INDEX IF NOT EXISTS ix_items_code_trgm ON items USING gin (code gin_trgm_ops)")
+    # 属性等值过滤编译为 properties @> {...}，由 jsonb_path_ops GIN 索引服务
+    await _run_ddl(
+        conn,
+        "CREATE INDEX IF NOT EXISTS ix_items_properties_path ON items USING gin (properties jsonb_path_ops)",
+    )
     await _run_ddl(
         conn,
         """
@@ -47,6 +82,380 @@ async def migrate_schema(conn: AsyncConnection) -> None:
         """,
     )
 
+    await _install_item_change_triggers(conn)
+    await _install_media_ref_triggers(conn)
+    await _install_low_stock_triggers(conn)
+    await _install_table_stats_triggers(conn)
+
+    # operation_logs 按月分区；旧版本的普通表在这里一次性转换
+    await convert_operation_logs(conn)
+    await ensure_log_partitions(conn)
+    # 审计日志过滤索引；建在分区父表上，自动作用于所有分区
+    await _run_ddl(
+        conn,
+        "CREATE INDEX IF NOT EXISTS ix_operation_logs_action_created_id ON operation_logs (action, created_at, id)",
+    )
+    await _run_ddl(
+        conn,
+        "CREATE INDEX IF NOT EXISTS ix_operation_logs_operator_created_id "
+        "ON operation_logs (operator_id, created_at, id)",
+    )
+    await _run_ddl(
+        conn,
+        "CREATE INDEX IF NOT EXISTS ix_operation_logs_target_created_id ON operation_logs (target, created_at, id)",
+    )
+    await _run_ddl(
+        conn,
+        "CREATE INDEX IF NOT EXISTS ix_operation_logs_item_created_id "
+        "ON operation_logs ((detail->>'item_id'), created_at, id)",
+    )
+    await _run_ddl(
+        conn,
+        "CREATE INDEX IF NOT EXISTS ix_operation_logs_auth_source_created_id "
+        "ON operation_logs ((detail->>'auth_source'), created_at, id)",
+    )
+    # 批量出入库的物料记录在 detail->'changes' 数组中，按 @> 包含查询
+    await _run_ddl(
+        conn,
+        "CREATE INDEX IF NOT EXISTS ix_operation_logs_changes_path "
+        "ON operation_logs USING gin ((detail->'changes') jsonb_path_ops)",
+    )
+    # 复合索引已覆盖单列查询
+    await _run_ddl(conn, "DROP INDEX IF EXISTS ix_operation_logs_action")
+    await _run_ddl(conn, "DROP INDEX IF EXISTS ix_operation_logs_operator_id")
+
+
+async def _install_item_change_triggers(conn: AsyncConnection) -> None:
+    first_install = not await _trigger_exists(conn, "trg_items_changes_insert")
+    # 语句级触发器 + transition table：导入、批量删除等多行写入也只触发一次
+    await _run_ddl(
+        conn,
+        """
+        CREATE OR REPLACE FUNCTION record_item_changes() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+          IF TG_OP = 'DELETE' THEN
+            INSERT INTO item_changes (item_id, table_id, deleted, txid, changed_at)
+            SELECT id, table_id, TRUE, pg_current_xact_id()::text::bigint, NOW() FROM old_rows
+            ON CONFLICT (item_id) DO UPDATE SET
+              table_id = EXCLUDED.table_id,
+              deleted = TRUE,
+              txid = EXCLUDED.txid,
+              changed_at = EXCLUDED.changed_at;
+          ELSE
+            INSERT INTO item_changes (item_id, table_id, deleted, txid, changed_at)
+            SELECT id, table_id, FALSE, pg_current_xact_id()::text::bigint, NOW() FROM new_rows
+            ON CONFLICT (item_id) DO UPDATE SET
+              table_id = EXCLUDED.table_id,
+              deleted = FALSE,
+              txid = EXCLUDED.txid,
+              changed_at = EXCLUDED.changed_at;
+          END IF;
+          RETURN NULL;
+        END
+        $$;
+        """,
+    )
+    await _run_ddl(
+        conn,
+        """
+        CREATE OR REPLACE TRIGGER trg_items_changes_insert
+        AFTER INSERT ON items REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION record_item_changes()
+        """,
+    )
+    await _run_ddl(
+        conn,
+        """
+        CREATE OR REPLACE TRIGGER trg_items_changes_update
+        AFTER UPDATE ON items REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION record_item_changes()
+        """,
+    )
+    await _run_ddl(
+        conn,
+        """
+        CREATE OR REPLACE TRIGGER trg_items_changes_delete
+        AFTER DELETE ON items REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION record_item_changes()
+        """,
+    )
+    if not first_install:
+        return
+    # 触发器上线前已有的物料以 txid = 0 补录，首次全量同步也走同一个接口
+    await _run_ddl(
+        conn,
+        """
+        INSERT INTO item_changes (item_id, table_id, deleted, txid, changed_at)
+        SELECT id, table_id, FALSE, 0, updated_at FROM items WHERE table_id IS NOT NULL
+        ON CONFLICT (item_id) DO NOTHING
+        """,
+    )
+
+
+async def _install_media_ref_triggers(conn: AsyncConnection) -> None:
+    # items 的图片列增减引用时同步调整 media_files.ref_count；按 path 排序加锁，避免并发写入互相死锁
+    await _run_ddl(
+        conn,
+        """
+        CREATE OR REPLACE FUNCTION track_media_refs() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+          IF TG_OP = 'INSERT' THEN
+            INSERT INTO media_files (path, ref_count, last_uploaded_at)
+            SELECT path, COUNT(*), NOW()
+            FROM (
+              SELECT image_original AS path FROM new_rows
+              UNION ALL SELECT image_thumb FROM new_rows
+            ) refs
+            WHERE path IS NOT NULL AND path <> ''
+            GROUP BY path ORDER BY path
+            ON CONFLICT (path) DO UPDATE SET ref_count = media_files.ref_count + EXCLUDED.ref_count;
+          ELSIF TG_OP = 'DELETE' THEN
+            UPDATE media_files m SET ref_count = GREATEST(m.ref_count - d.delta, 0)
+            FROM (
+              SELECT path, COUNT(*) AS delta
+              FROM (
+                SELECT image_original AS path FROM old_rows
+                UNION ALL SELECT image_thumb FROM old_rows
+              ) refs
+              WHERE path IS NOT NULL AND path <> ''
+              GROUP BY path
+            ) d
+            WHERE m.path = d.path;
+          ELSE
+            INSERT INTO media_files (path, ref_count, last_uploaded_at)
+            SELECT path, SUM(delta), NOW()
+            FROM (
+              SELECT image_original AS path, 1 AS delta FROM new_rows
+              UNION ALL SELECT image_thumb, 1 FROM new_rows
+              UNION ALL SELECT image_original, -1 FROM old_rows
+              UNION ALL SELECT image_thumb, -1 FROM old_rows
+            ) refs
+            WHERE path IS NOT NULL AND path <> ''
+            GROUP BY path HAVING SUM(delta) <> 0 ORDER BY path
+            ON CONFLICT (path) DO UPDATE SET ref_count = GREATEST(media_files.ref_count + EXCLUDED.ref_count, 0);
+          END IF;
+          RETURN NULL;
+        END
+        $$;
+        """,
+    )
+    if not await _trigger_exists(conn, "trg_items_media_refs_insert"):
+        await _backfill_media_refs(conn)
+    for operation, transition in (
+        ("INSERT", "NEW TABLE AS new_rows"),
+        ("UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows"),
+        ("DELETE", "OLD TABLE AS old_rows"),
+    ):
+        await _run_ddl(
+            conn,
+            f"""
+            CREATE OR REPLACE TRIGGER trg_items_media_refs_{operation.lower()}
+            AFTER {operation} ON items REFERENCING {transition}
+            FOR EACH STATEMENT EXECUTE FUNCTION track_media_refs()
+            """,
+        )
+
+
+async def _backfill_media_refs(conn: AsyncConnection) -> None:
+    # 触发器首次安装时按 items 核算一次引用数，历史数据也能纳入计数；
+    # 核算到建好触发器之间挡住 items 写入，避免与其它实例的并发写入互相覆盖
+    await _run_ddl(conn, "LOCK TABLE items IN SHARE MODE")
+    await _run_ddl(
+        conn,
+        """
+        INSERT INTO media_files (path, ref_count, last_uploaded_at)
+        SELECT path, COUNT(*), NOW()
+        FROM (
+          SELECT image_original AS path FROM items
+          UNION ALL SELECT image_thumb FROM items
+        ) refs
+        WHERE path IS NOT NULL AND path <> ''
+        GROUP BY path
+        ON CONFLICT (path) DO UPDATE SET ref_count = EXCLUDED.ref_count
+        """,
+    )
+    await _run_ddl(
+        conn,
+        """
+        UPDATE media_files SET ref_count = 0
+        WHERE ref_count <> 0 AND path NOT IN (
+          SELECT image_original FROM items WHERE image_original IS NOT NULL
+          UNION SELECT image_thumb FROM items WHERE image_thumb IS NOT NULL
+        )
+        """,
+    )
+
+
+async def _install_low_stock_triggers(conn: AsyncConnection) -> None:
+    first_install = not await _trigger_exists(conn, "trg_items_low_stock_update")
+    # 表格默认阈值取自 schema.low_stock_threshold；物料设置 reorder_level 时以物料为准
+    await _run_ddl(
+        conn,
+        """
+        CREATE OR REPLACE FUNCTION inventory_low_stock_threshold(table_schema JSONB) RETURNS INTEGER
+        LANGUAGE sql IMMUTABLE AS $$
+          SELECT CASE WHEN jsonb_typeof(table_schema -> 'low_stock_threshold') = 'number'
+                      THEN floor((table_schema ->> 'low_stock_threshold')::numeric)::integer END
+        $$;
+        """,
+    )
+    # 行级 BEFORE 触发器随每次写入增量判断，出库、批量出入库、导入、编辑都走同一份逻辑；
+    # 只在由正常变为低库存的那一次写入记录事件，持续出库不会重复告警
+    await _run_ddl(
+        conn,
+        f"""
+        CREATE OR REPLACE FUNCTION maintain_item_low_stock() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        DECLARE
+          threshold INTEGER := NEW.reorder_level;
+        BEGIN
+          IF threshold IS NULL THEN
+            SELECT inventory_low_stock_threshold(t.schema) INTO threshold
+            FROM inventory_tables t WHERE t.id = NEW.table_id;
+          END IF;
+          NEW.is_low_stock := COALESCE(NEW.quantity <= threshold, FALSE);
+          IF TG_OP = 'UPDATE' AND NEW.is_low_stock AND NOT OLD.is_low_stock THEN
+            INSERT INTO operation_logs (id, operator_id, action, target, summary, detail, created_at)
+            VALUES (
+              gen_random_uuid(), NULL, 'low_stock', NEW.code,
+              'Item ' || NEW.code || ' reached low stock (' || NEW.quantity || ' <= ' || threshold || ')',
+              jsonb_build_object(
+                'item_id', NEW.id::text, 'table_id', NEW.table_id::text,
+                'quantity', NEW.quantity, 'threshold', threshold, 'auth_source', 'system'
+              ),
+              NOW()
+            );
+            PERFORM pg_notify('{CHANNEL}', json_build_object(
+              'kind', 'item', 'op', 'low_stock', 'table_id', NEW.table_id::text, 'item_id', NEW.id::text,
+              'code', NEW.code, 'quantity', NEW.quantity, 'threshold', threshold
+            )::text);
+          END IF;
+          RETURN NEW;
+        END
+        $$;
+        """,
+    )
+    await _run_ddl(
+        conn,
+        """
+        CREATE OR REPLACE TRIGGER trg_items_low_stock_insert
+        BEFORE INSERT ON items
+        FOR EACH ROW EXECUTE FUNCTION maintain_item_low_stock()
+        """,
+    )
+    await _run_ddl(
+        conn,
+        """
+        CREATE OR REPLACE TRIGGER trg_items_low_stock_update
+        BEFORE UPDATE OF quantity, reorder_level, table_id ON items
+        FOR EACH ROW EXECUTE FUNCTION maintain_item_low_stock()
+        """,
+    )
+    if not first_install:
+        return
+    # 触发器首次安装时按当前阈值补齐历史数据的标记，之后由触发器逐行维护；
+    # 补齐只写 is_low_stock，不会触发 UPDATE OF quantity 的低库存事件
+    await _run_ddl(conn, "LOCK TABLE items IN SHARE MODE")
+    await _run_ddl(
+        conn,
+        """
+        UPDATE items i
+        SET is_low_stock = f.low
+        FROM (
+          SELECT i2.id,
+                 COALESCE(i2.quantity <= COALESCE(i2.reorder_level, inventory_low_stock_threshold(t.schema)), FALSE)
+                   AS low
+          FROM items i2 JOIN inventory_tables t ON t.id = i2.table_id
+        ) f
+        WHERE f.id = i.id AND i.is_low_stock IS DISTINCT FROM f.low
+        """,
+    )
+
+
+async def _install_table_stats_triggers(conn: AsyncConnection) -> None:
+    # 新行记 +1、旧行记 -1，按表格聚合后追加为增量行；只 INSERT、不更新共享的汇总行，
+    # 同一表格的并发写入互不等待，汇总由 table_stats.compact_table_stats 定期并入
+    await _run_ddl(
+        conn,
+        """
+        CREATE OR REPLACE FUNCTION maintain_inventory_table_stats() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+          -- UPDATE 同时减去旧行、加上新行，物料换表、数量变化都能正确反映；净变化为 0 时不写增量
+          IF TG_OP = 'UPDATE' THEN
+            INSERT INTO inventory_table_stats_deltas
+              (table_id, item_count, total_quantity, zero_stock_count, low_stock_count, created_at)
+            SELECT d.table_id, SUM(d.n), SUM(d.q), SUM(d.z), SUM(d.l), NOW()
+            FROM (
+              SELECT table_id, -1 AS n, -quantity AS q, -(quantity <= 0)::int AS z, -is_low_stock::int AS l
+              FROM old_rows
+              UNION ALL
+              SELECT table_id, 1, quantity, (quantity <= 0)::int, is_low_stock::int FROM new_rows
+            ) d
+            GROUP BY d.table_id
+            HAVING SUM(d.n) <> 0 OR SUM(d.q) <> 0 OR SUM(d.z) <> 0 OR SUM(d.l) <> 0;
+          ELSIF TG_OP = 'DELETE' THEN
+            INSERT INTO inventory_table_stats_deltas
+              (table_id, item_count, total_quantity, zero_stock_count, low_stock_count, created_at)
+            SELECT d.table_id, -COUNT(*), -SUM(d.quantity),
+                   -COUNT(*) FILTER (WHERE d.quantity <= 0),
+                   -COUNT(*) FILTER (WHERE d.is_low_stock),
+                   NOW()
+            FROM old_rows d
+            GROUP BY d.table_id;
+          ELSE
+            INSERT INTO inventory_table_stats_deltas
+              (table_id, item_count, total_quantity, zero_stock_count, low_stock_count, created_at)
+            SELECT d.table_id, COUNT(*), SUM(d.quantity),
+                   COUNT(*) FILTER (WHERE d.quantity <= 0),
+                   COUNT(*) FILTER (WHERE d.is_low_stock),
+                   NOW()
+            FROM new_rows d
+            GROUP BY d.table_id;
+          END IF;
+          RETURN NULL;
+        END
+        $$;
+        """,
+    )
+    # 触发器首次安装时按 items 全量核算一次，历史数据也纳入统计；之后由触发器增量维护
+    if not await _trigger_exists(conn, "trg_items_table_stats_insert"):
+        await _run_ddl(conn, "LOCK TABLE items IN SHARE MODE")
+        await _run_ddl(
+            conn,
+            """
+            INSERT INTO inventory_table_stats
+              (table_id, item_count, total_quantity, zero_stock_count, low_stock_count, updated_at)
+            SELECT t.id, COUNT(i.id), COALESCE(SUM(i.quantity), 0),
+                   COUNT(i.id) FILTER (WHERE i.quantity <= 0),
+                   COUNT(i.id) FILTER (WHERE i.is_low_stock),
+                   NOW()
+            FROM inventory_tables t LEFT JOIN items i ON i.table_id = t.id
+            GROUP BY t.id
+            ON CONFLICT (table_id) DO UPDATE SET
+              item_count = EXCLUDED.item_count,
+              total_quantity = EXCLUDED.total_quantity,
+              zero_stock_count = EXCLUDED.zero_stock_count,
+              low_stock_count = EXCLUDED.low_stock_count,
+              updated_at = EXCLUDED.updated_at
+            """,
+        )
+    for operation, transition in (
+        ("INSERT", "NEW TABLE AS new_rows"),
+        ("UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows"),
+        ("DELETE", "OLD TABLE AS old_rows"),
+    ):
+        await _run_ddl(
+            conn,
+            f"""
+            CREATE OR REPLACE TRIGGER trg_items_table_stats_{operation.lower()}
+            AFTER {operation} ON items REFERENCING {transition}
+            FOR EACH STATEMENT EXECUTE FUNCTION maintain_inventory_table_stats()
+            """,
+        )
+
 
 async def ensure_default_table(session: AsyncSession) -> InventoryTable:
     result = await session.execute(select(InventoryTable).where(InventoryTable.name == "默认表"))
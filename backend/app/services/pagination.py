@@ -0,0 +1,39 @@
+import base64
+import uuid
+from datetime import datetime
+
+from fastapi import HTTPException, status
+
+
+def encode_cursor(sort_value: datetime, row_id: uuid.UUID) -> str:
+    raw = f"{sort_value.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8")
+        sort_part, id_part = raw.split("|", 1)
+        sort_value = datetime.fromisoformat(sort_part)
+        row_id = uuid.UUID(id_part)
+    except (ValueError, UnicodeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="无效的分页游标") from None
+    if sort_value.tzinfo is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="无效的分页游标")
+    return sort_value, row_id
+
+
+def encode_change_cursor(txid: int, item_id: uuid.UUID) -> str:
+    raw = f"{txid}|{item_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_change_cursor(cursor: str) -> tuple[int, uuid.UUID]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8")
+        txid_part, id_part = raw.split("|", 1)
+        return int(txid_part), uuid.UUID(id_part)
+    except (ValueError, UnicodeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="无效的同步游标") from None
@@ -0,0 +1,36 @@
+import uuid
+from datetime import datetime
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Item, StockMovement, now_utc
+
+
+def movement_row(
+    item: Item,
+    delta: int,
+    source: str,
+    operator_id: uuid.UUID | None,
+    created_at: datetime | None = None,
+    quantity_after: int | None = None,
+) -> dict:
+    # item 也可以是带 id/table_id/code/quantity 的 RETURNING 结果行；删除时 quantity_after 传 0
+    return {
+        "id": uuid.uuid4(),
+        "item_id": item.id,
+        "table_id": item.table_id,
+        "code": item.code,
+        "delta": delta,
+        "quantity_after": item.quantity if quantity_after is None else quantity_after,
+        "operator_id": operator_id,
+        "source": source,
+        "created_at": created_at or now_utc(),
+    }
+
+
+async def record_movements(session: AsyncSession, rows: list[dict]) -> None:
+    # 同一事务内的多条流水合并为一条多行 INSERT
+    rows = [row for row in rows if row["delta"]]
+    if rows:
+        await session.execute(insert(StockMovement), rows)
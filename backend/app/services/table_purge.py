@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any
+
+from fastapi import HTTPException, status
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import AsyncSessionLocal
+from app.models import InventoryTable, Item, now_utc
+from app.services.change_versions import bump_table_version
+from app.services.events import publish_events, table_event
+from app.services.jobs import prune_finished_jobs
+from app.services.logs import log_operation
+from app.services.media_store import cleanup_unreferenced_media
+from app.services.stock_movements import movement_row, record_movements
+
+logger = logging.getLogger(__name__)
+
+PURGE_CHUNK_SIZE = 1000
+# 物料数超过该值时改为后台分批删除，接口立即返回 202
+INLINE_PURGE_LIMIT = 2000
+
+
+@dataclass(eq=False)
+class PurgeJob:
+    table_id: uuid.UUID
+    table_name: str
+    total: int
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    deleted: int = 0
+    status: str = "running"
+    error: str | None = None
+    started_at: datetime = field(default_factory=now_utc)
+    finished_at: datetime | None = None
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "table_id": str(self.table_id),
+            "table_name": self.table_name,
+            "status": self.status,
+            "total": self.total,
+            "deleted": self.deleted,
+            "error": self.error,
+            "started_at": self.started_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+# 任务进度保存在进程内，结束后按 FINISHED_JOB_TTL_SECONDS 淘汰；
+# 后端只支持单进程部署（不开 uvicorn --workers），查询与执行落在同一进程
+_jobs: dict[str, PurgeJob] = {}
+_tasks: set[asyncio.Task] = set()
+
+
+def get_purge_job(job_id: str) -> PurgeJob | None:
+    prune_finished_jobs(_jobs)
+    return _jobs.get(job_id)
+
+
+def running_purge_job(table_id: uuid.UUID) -> PurgeJob | None:
+    for job in _jobs.values():
+        if job.table_id == table_id and job.status == "running":
+            return job
+    return None
+
+
+async def delete_table_items(
+    session: AsyncSession,
+    table_id: uuid.UUID,
+    operator_id: uuid.UUID | None,
+    limit: int | None = None,
+) -> tuple[int, set[str]]:
+    # DELETE ... RETURNING 一次拿回被删物料的图片路径与数量，不再单独查询
+    stmt = delete(Item)
+    if limit is None:
+        stmt = stmt.where(Item.table_id == table_id)
+    else:
+        stmt = stmt.where(Item.id.in_(select(Item.id).where(Item.table_id == table_id).limit(limit)))
+    result = await session.execute(
+        stmt.returning(
+            Item.id, Item.table_id, Item.code, Item.quantity, Item.image_original, Item.image_thumb
+        ).execution_options(synchronize_session=False)
+    )
+    rows = result.all()
+    await record_movements(
+        session,
+        [movement_row(row, -row.quantity, "table_purge", operator_id, quantity_after=0) for row in rows],
+    )
+    paths = {path for row in rows for path in (row.image_original, row.image_thumb) if path}
+    return len(rows), paths
+
+
+async def delete_table_now(
+    session: AsyncSession,
+    table: InventoryTable,
+    operator_id: uuid.UUID | None,
+    purge_items: bool,
+    deleted_before: int = 0,
+) -> int:
+    deleted_items = deleted_before
+    stale_paths: set[str] = set()
+    if purge_items:
+        deleted_count, stale_paths = await delete_table_items(session, table.id, operator_id)
+        deleted_items += deleted_count
+
+    table_id = table.id
+    table_name = table.name
+    await session.delete(table)
+    await log_operation(
+        session=session,
+        action="delete_table",
+        target=table_name,
+        summary=f"Delete table {table_name}",
+        detail={"table_id": str(table_id), "purge_items": purge_items, "deleted_items": deleted_items},
+        operator_id=operator_id,
+    )
+    await publish_events(session, [table_event("deleted", table_id)])
+    try:
+        await session.commit()
+    except IntegrityError:
+        # 删除期间有新物料写入该表，外键 RESTRICT 拒绝删除表格，整体回滚
+        await session.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"code": "TABLE_HAS_ITEMS", "message": "删除期间该表有新数据写入，请重试"},
+        ) from None
+
+    # BUG-04: 提交后清理孤立图片文件
+    await cleanup_unreferenced_media(session, stale_paths)
+    return deleted_items
+
+
+async def _run_purge(job: PurgeJob, operator_id: uuid.UUID | None) -> None:
+    try:
+        while True:
+            # 每批单独提交，单个事务持锁时间与批大小相关，而不是与整表大小相关
+            async with AsyncSessionLocal() as session:
+                bump_table_version(session, job.table_id)
+                deleted_count, stale_paths = await delete_table_items(
+                    session, job.table_id, operator_id, PURGE_CHUNK_SIZE
+                )
+                await session.commit()
+                job.deleted += deleted_count
+                await cleanup_unreferenced_media(session, stale_paths)
+            if deleted_count < PURGE_CHUNK_SIZE:
+                break
+
+        async with AsyncSessionLocal() as session:
+            table = await session.get(InventoryTable, job.table_id)
+            if table:
+                # 分批期间新写入的少量物料在最后一个事务里连同表格一起删除
+                job.deleted = await delete_table_now(session, table, operator_id, True, job.deleted)
+        job.status = "completed"
+    except Exception as exc:
+        logger.exception("后台删除表格 %s 失败", job.table_id)
+        job.status = "failed"
+        job.error = str(exc) or exc.__class__.__name__
+    finally:
+        job.finished_at = now_utc()
+
+
+def start_purge_job(table: InventoryTable, total: int, operator_id: uuid.UUID | None) -> PurgeJob:
+    prune_finished_jobs(_jobs)
+    job = PurgeJob(table_id=table.id, table_name=table.name, total=total)
+    _jobs[job.id] = job
+    task = asyncio.create_task(_run_purge(job, operator_id))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return job
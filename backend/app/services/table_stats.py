@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import uuid
+from typing import Any
+
+from sqlalchemy import Row, func, literal, select, text, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models import InventoryTable, InventoryTableStats, InventoryTableStatsDelta
+
+logger = logging.getLogger(__name__)
+
+# 表格默认阈值变更后重新标记沿用表格阈值的物料；统计增量由 items 上的触发器追加，
+# 配置变更导致的标记变化不属于库存消耗，不产生低库存事件。
+# 阈值由调用方传入、不再关联 inventory_tables，物料行按 code 顺序加锁：与物料写入一致，
+# 先锁物料、提交前再由 _apply_table_versions 锁表格行，两侧加锁顺序相同
+_REFRESH_LOW_STOCK_SQL = text(
+    """
+    UPDATE items i
+    SET is_low_stock = COALESCE(i.quantity <= CAST(:threshold AS INTEGER), FALSE)
+    FROM (
+      SELECT id FROM items
+      WHERE table_id = CAST(:table_id AS UUID)
+        AND reorder_level IS NULL
+        AND is_low_stock IS DISTINCT FROM COALESCE(quantity <= CAST(:threshold AS INTEGER), FALSE)
+      ORDER BY code
+      FOR UPDATE
+    ) locked
+    WHERE i.id = locked.id
+    """
+)
+
+
+def schema_low_stock_threshold(schema: dict[str, Any] | None) -> int | None:
+    # 与数据库函数 inventory_low_stock_threshold 保持一致
+    value = (schema or {}).get("low_stock_threshold")
+    if isinstance(value, bool) or not isinstance(value, int | float):
+        return None
+    return int(value // 1)
+
+
+def low_stock_threshold(table: InventoryTable) -> int | None:
+    return schema_low_stock_threshold(table.schema)
+
+
+async def refresh_low_stock_flags(session: AsyncSession, table_id: uuid.UUID, threshold: int | None) -> None:
+    await session.execute(_REFRESH_LOW_STOCK_SQL, {"table_id": table_id, "threshold": threshold})
+
+
+# 把已提交的增量行并入汇总行：删除与累加在同一语句内完成，并发追加的新增量留到下一轮；
+# 表格已删除的增量随 DELETE 一并丢弃
+_COMPACT_SQL = text(
+    """
+    WITH moved AS (
+      DELETE FROM inventory_table_stats_deltas
+      RETURNING table_id, item_count, total_quantity, zero_stock_count, low_stock_count
+    )
+    INSERT INTO inventory_table_stats
+      (table_id, item_count, total_quantity, zero_stock_count, low_stock_count, updated_at)
+    SELECT m.table_id, SUM(m.item_count), SUM(m.total_quantity), SUM(m.zero_stock_count), SUM(m.low_stock_count), NOW()
+    FROM moved m
+    JOIN inventory_tables t ON t.id = m.table_id
+    GROUP BY m.table_id
+    ORDER BY m.table_id
+    ON CONFLICT (table_id) DO UPDATE SET
+      item_count = inventory_table_stats.item_count + EXCLUDED.item_count,
+      total_quantity = inventory_table_stats.total_quantity + EXCLUDED.total_quantity,
+      zero_stock_count = inventory_table_stats.zero_stock_count + EXCLUDED.zero_stock_count,
+      low_stock_count = inventory_table_stats.low_stock_count + EXCLUDED.low_stock_count,
+      updated_at = EXCLUDED.updated_at
+    """
+)
+
+
+def _stats_query(table_ids: list[uuid.UUID]):
+    # 汇总行与尚未并入的增量行相加，结果字段与 InventoryTableStats 同名
+    base = select(
+        InventoryTableStats.table_id,
+        InventoryTableStats.item_count,
+        InventoryTableStats.total_quantity,
+        InventoryTableStats.zero_stock_count,
+        InventoryTableStats.low_stock_count,
+        InventoryTableStats.updated_at,
+    ).where(InventoryTableStats.table_id.in_(table_ids))
+    deltas = select(
+        InventoryTableStatsDelta.table_id,
+        InventoryTableStatsDelta.item_count,
+        InventoryTableStatsDelta.total_quantity,
+        InventoryTableStatsDelta.zero_stock_count,
+        InventoryTableStatsDelta.low_stock_count,
+        InventoryTableStatsDelta.created_at,
+    ).where(InventoryTableStatsDelta.table_id.in_(table_ids))
+    combined = union_all(base, deltas).subquery()
+    return select(
+        combined.c.table_id,
+        func.coalesce(func.sum(combined.c.item_count), literal(0)).label("item_count"),
+        func.coalesce(func.sum(combined.c.total_quantity), literal(0)).label("total_quantity"),
+        func.coalesce(func.sum(combined.c.zero_stock_count), literal(0)).label("zero_stock_count"),
+        func.coalesce(func.sum(combined.c.low_stock_count), literal(0)).label("low_stock_count"),
+        func.max(combined.c.updated_at).label("updated_at"),
+    ).group_by(combined.c.table_id)
+
+
+async def load_table_stats(
+    session: AsyncSession,
+    table_ids: list[uuid.UUID],
+) -> dict[uuid.UUID, Row]:
+    if not table_ids:
+        return {}
+    result = await session.execute(_stats_query(table_ids))
+    return {row.table_id: row for row in result.all()}
+
+
+async def table_item_count(session: AsyncSession, table_id: uuid.UUID) -> int:
+    # 统计由触发器维护，只反映已提交的写入；调用方需自行处理并发写入（如依赖外键约束）
+    stats = (await load_table_stats(session, [table_id])).get(table_id)
+    return int(stats.item_count) if stats else 0
+
+
+async def compact_table_stats() -> None:
+    async with AsyncSessionLocal() as session:
+        await session.execute(_COMPACT_SQL)
+        await session.commit()
+
+
+async def run_table_stats_compactor() -> None:
+    interval = settings.table_stats_compact_seconds
+    if interval <= 0:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await compact_table_stats()
+        except Exception:
+            logger.exception("表格统计增量合并失败")
+
+
+def stats_response(table_id: uuid.UUID, stats: Row | None) -> dict[str, Any]:
+    # 尚未写入过物料的表格没有统计行，按全 0 返回
+    return {
+        "table_id": str(table_id),
+        "item_count": stats.item_count if stats else 0,
+        "total_quantity": stats.total_quantity if stats else 0,
+        "zero_stock_count": stats.zero_stock_count if stats else 0,
+        "low_stock_count": stats.low_stock_count if stats else 0,
+        "updated_at": stats.updated_at if stats else None,
+    }
@@ -2,6 +2,10 @@ import { defineStore } from "pinia";
 
 import http from "../api/http";
 
+// /items/page 单页上限为 500；刷新时最多重新拉取这么多条，更早加载的分页会被收起
+const PAGE_SIZE = 100;
+const MAX_PAGE_SIZE = 500;
+
 function deepCopy(obj) {
   return JSON.parse(JSON.stringify(obj));
 }
@@ -9,7 +13,9 @@ function deepCopy(obj) {
 export const useItemsStore = defineStore("items", {
   state: () => ({
     items: [],
+    nextCursor: null,
     loading: false,
+    loadingMore: false,
     filters: {
       table_id: "",
       q: "",
@@ -18,6 +24,12 @@ export const useItemsStore = defineStore("items", {
       max_quantity: null,
     },
     pollingTimer: null,
+    liveUpdates: false,
+    eventStreamController: null,
+    refreshTimer: null,
+    etag: "",
+    etagParamsKey: "",
+    etagQueryKey: "",
   }),
 
   getters: {
@@ -52,13 +64,50 @@ export const useItemsStore = defineStore("items", {
     async fetchItems() {
       this.loading = true;
       try {
-        const { data } = await http.get("/items", { params: this.buildParams() });
-        this.items = data;
+        const filters = this.buildParams();
+        const filtersKey = JSON.stringify(filters);
+        // 刷新时按已加载条数重新拉取首页，保留用户已经“加载更多”的内容；筛选条件变化时回到首页
+        const loaded = this.etagParamsKey === filtersKey ? this.items.length : 0;
+        const params = { ...filters, limit: Math.min(MAX_PAGE_SIZE, Math.max(PAGE_SIZE, loaded)) };
+        const paramsKey = JSON.stringify(params);
+        // 轮询时带上 If-None-Match，数据未变化时服务端返回 304，不再替换列表
+        const headers = this.etag && this.etagQueryKey === paramsKey ? { "If-None-Match": this.etag } : {};
+        const response = await http.get("/items/page", {
+          params,
+          headers,
+          validateStatus: (status) => (status >= 200 && status < 300) || status === 304,
+        });
+        if (response.status === 304) {
+          return;
+        }
+        this.items = response.data.items;
+        this.nextCursor = response.data.next_cursor;
+        this.etag = response.headers.etag || "";
+        this.etagParamsKey = filtersKey;
+        this.etagQueryKey = paramsKey;
       } finally {
         this.loading = false;
       }
     },
 
+    async loadMoreItems() {
+      if (!this.nextCursor || this.loadingMore) {
+        return;
+      }
+      this.loadingMore = true;
+      try {
+        const { data } = await http.get("/items/page", {
+          params: { ...this.buildParams(), limit: PAGE_SIZE, cursor: this.nextCursor },
+        });
+        // 翻页期间有物料更新会移到首页，按 id 去重
+        const loadedIds = new Set(this.items.map((item) => item.id));
+        this.items = [...this.items, ...data.items.filter((item) => !loadedIds.has(item.id))];
+        this.nextCursor = data.next_cursor;
+      } finally {
+        this.loadingMore = false;
+      }
+    },
+
     async fetchItem(itemId) {
       const { data } = await http.get(`/items/${itemId}`);
       this.upsertItem(data);
@@ -192,8 +241,102 @@ export const useItemsStore = defineStore("items", {
       return data;
     },
 
-    startPolling() {
-      if (this.pollingTimer) {
+    scheduleRefresh() {
+      if (this.refreshTimer) {
+        return;
+      }
+      // 合并短时间内的多条事件，只重新拉取一次
+      this.refreshTimer = window.setTimeout(() => {
+        this.refreshTimer = null;
+        this.fetchItems().catch(() => {});
+      }, 300);
+    },
+
+    applyEvent(event) {
+      if (this.filters.table_id && event.table_id && event.table_id !== this.filters.table_id) {
+        return;
+      }
+      if (event.kind === "item" && event.op === "deleted") {
+        this.items = this.items.filter((item) => item.id !== event.item_id);
+        return;
+      }
+      if (event.kind === "item" && event.op === "low_stock") {
+        const index = this.items.findIndex((item) => item.id === event.item_id);
+        if (index >= 0) {
+          this.items[index].quantity = event.quantity;
+          this.items[index].is_low_stock = true;
+          return;
+        }
+      }
+      if (event.kind === "item" && String(event.op || "").startsWith("stock_")) {
+        const index = this.items.findIndex((item) => item.id === event.item_id);
+        if (index >= 0) {
+          this.items[index].quantity = event.quantity;
+          return;
+        }
+      }
+      this.scheduleRefresh();
+    },
+
+    async runEventStream() {
+      const controller = new AbortController();
+      this.eventStreamController = controller;
+      // EventSource 无法携带 Authorization 头，这里用 fetch 读取 SSE
+      const response = await fetch(`${http.defaults.baseURL || ""}/events/items`, {
+        headers: {
+          Accept: "text/event-stream",
+          Authorization: http.defaults.headers.common.Authorization || "",
+        },
+        signal: controller.signal,
+      });
+      if (!response.ok || !response.body) {
+        throw new Error(`事件流连接失败: ${response.status}`);
+      }
+
+      this.stopFallbackPolling();
+      this.fetchItems().catch(() => {});
+      const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+      let buffer = "";
+      for (;;) {
+        const { value, done } = await reader.read();
+        if (done) {
+          return;
+        }
+        buffer += value;
+        let boundary = buffer.indexOf("\n\n");
+        while (boundary >= 0) {
+          const block = buffer.slice(0, boundary);
+          buffer = buffer.slice(boundary + 2);
+          const data = block
+            .split("\n")
+            .filter((line) => line.startsWith("data:"))
+            .map((line) => line.slice(5).trim())
+            .join("\n");
+          if (data) {
+            this.applyEvent(JSON.parse(data));
+          }
+          boundary = buffer.indexOf("\n\n");
+        }
+      }
+    },
+
+    async connectEventStream() {
+      while (this.liveUpdates) {
+        try {
+          await this.runEventStream();
+        } catch (error) {
+          if (!this.liveUpdates) {
+            return;
+          }
+        }
+        // 事件流断开期间退回轮询，稍后重连
+        this.startFallbackPolling();
+        await new Promise((resolve) => window.setTimeout(resolve, 5000));
+      }
+    },
+
+    startFallbackPolling() {
+      if (this.pollingTimer || !this.liveUpdates) {
         return;
       }
       this.pollingTimer = window.setInterval(() => {
@@ -201,12 +344,33 @@ export const useItemsStore = defineStore("items", {
       }, 5000);
     },
 
-    stopPolling() {
+    stopFallbackPolling() {
       if (!this.pollingTimer) {
         return;
       }
       window.clearInterval(this.pollingTimer);
       this.pollingTimer = null;
     },
+
+    startPolling() {
+      if (this.liveUpdates) {
+        return;
+      }
+      this.liveUpdates = true;
+      this.connectEventStream();
+    },
+
+    stopPolling() {
+      this.liveUpdates = false;
+      if (this.eventStreamController) {
+        this.eventStreamController.abort();
+        this.eventStreamController = null;
+      }
+      if (this.refreshTimer) {
+        window.clearTimeout(this.refreshTimer);
+        this.refreshTimer = null;
+      }
+      this.stopFallbackPolling();
+    },
   },
 });
@@ -66,5 +66,21 @@ export const useTablesStore = defineStore("tables", {
         this.setActiveTable(this.tables[0]?.id || "");
       }
     },
+    async purgeTable(tableId, onProgress) {
+      const response = await http.delete(`/tables/${tableId}`, { params: { purge_items: true } });
+      if (response.status === 202) {
+        // 大表由后端分批删除，轮询任务进度直到结束
+        let job = response.data;
+        while (job.status === "running") {
+          onProgress?.(job);
+          await new Promise((resolve) => window.setTimeout(resolve, 1000));
+          ({ data: job } = await http.get(`/tables/purge-jobs/${job.job_id}`));
+        }
+        if (job.status !== "completed") {
+          throw new Error(job.error || "后台删除失败");
+        }
+      }
+      await this.fetchTables();
+    },
   },
 });
@@ -7,3 +7,10 @@ export function mediaUrl(path) {
   }
   return `/api/media/${path}`;
 }
+
+export function variantUrl(path, width, format = "webp") {
+  if (!path || path.startsWith("http://") || path.startsWith("https://")) {
+    return mediaUrl(path);
+  }
+  return `/api/media-variants/${path}?w=${width}&format=${format}`;
+}